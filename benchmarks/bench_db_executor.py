@@ -0,0 +1,89 @@
+"""Пропускная способность обновлений во время долгой записи в БД
+
+Сравнивает запросы прямо в цикле событий и через пул ``dao``:
+пока идёт большая транзакция, «обновления» читают помещение из БД,
+считаем сколько обновлений успело обработаться.
+
+    python benchmarks/bench_db_executor.py
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dao  # noqa: E402
+from models import Appeal, Room, User, db, create_tables  # noqa: E402
+
+
+WRITE_ROWS = 100_000
+CONSUMERS = 20
+
+
+def long_write(room_id: int) -> None:
+    """Большая транзакция, как при массовом импорте"""
+    with db.atomic():
+        for start in range(0, WRITE_ROWS, 1000):
+            Appeal.insert_many(
+                [(room_id, 1, f"appeal {i}") for i in range(start, start + 1000)],
+                fields=[Appeal.room, Appeal.author, Appeal.message],
+            ).execute()
+
+
+async def consumer(get_room, room_id: int, done: asyncio.Event, stats: list):
+    while not done.is_set():
+        started = time.perf_counter()
+        await get_room(room_id)
+        stats.append(time.perf_counter() - started)
+        await asyncio.sleep(0)
+
+
+async def scenario(name: str, offload: bool, room_id: int) -> None:
+    done = asyncio.Event()
+    stats: list = []
+    if offload:
+        get_room = dao.get_room
+    else:
+        async def get_room(room_id):
+            return dao.get_room.__wrapped__(room_id)
+
+    consumers = [
+        asyncio.create_task(consumer(get_room, room_id, done, stats))
+        for _ in range(CONSUMERS)
+    ]
+    await asyncio.sleep(0.1)
+    stats.clear()
+    started = time.perf_counter()
+    if offload:
+        await dao.run(long_write, room_id)
+    else:
+        long_write(room_id)
+    elapsed = time.perf_counter() - started
+    done.set()
+    await asyncio.gather(*consumers)
+    worst = max(stats) * 1000 if stats else float("nan")
+    print(
+        f"{name:10} запись {elapsed:6.2f} с, обновлений {len(stats):7}, "
+        f"{len(stats) / elapsed:9.1f}/с, худшая задержка {worst:8.1f} мс"
+    )
+
+
+async def main() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        # Профиль DB_PROFILE=performance включает WAL: читатели
+        # не ждут пишущую транзакцию
+        db.init(os.path.join(tmp, "bench.db"))
+        os.environ.setdefault("ADMIN_ID", "1")
+        create_tables()
+        User.get_or_create(id=1)
+        room = Room.create(name="bench", creator=1)
+        await scenario("в цикле", offload=False, room_id=room.id)
+        await scenario("через dao", offload=True, room_id=room.id)
+        dao.EXECUTOR.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+"""Накладные расходы FSM-хранилища на одно обновление
+
+Каждое «обновление» делает то же, что мастер в обработчике: читает
+состояние, читает данные и обновляет их. Сравниваются MemoryStorage и
+SQLiteStorage из fsm_storage.
+
+    python benchmarks/bench_fsm_storage.py [обновлений] [пользователей]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+
+from fsm_storage import SQLiteStorage  # noqa: E402
+from states import AddNotify  # noqa: E402
+
+
+async def run(storage, updates: int, users: int) -> float:
+    rooms = [(room_id, f"Аудитория {room_id}", False) for room_id in range(50)]
+    started = time.perf_counter()
+    for i in range(updates):
+        key = StorageKey(bot_id=1, chat_id=i % users, user_id=i % users)
+        if await storage.get_state(key) is None:
+            await storage.set_state(key, AddNotify.waiting_room_and_user)
+        data = await storage.get_data(key)
+        data.setdefault("rooms", rooms)
+        data["clicks"] = data.get("clicks", 0) + 1
+        await storage.update_data(key, data)
+    elapsed = time.perf_counter() - started
+    await storage.close()
+    return elapsed
+
+
+async def main(updates: int, users: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        storages = {
+            "memory": MemoryStorage(),
+            "sqlite": SQLiteStorage(os.path.join(tmp, "fsm.db")),
+        }
+        for name, storage in storages.items():
+            elapsed = await run(storage, updates, users)
+            print(
+                f"{name:7} {elapsed * 1e6 / updates:8.1f} мкс/обновление "
+                f"({updates} обновлений, {users} пользователей)"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 1_000,
+    ))
@@ -0,0 +1,125 @@
+"""Время запуска бота
+
+Каждый замер - отдельный процесс python с холодным импортом. Этапы
+от начала процесса до готовности принимать обновления:
+
+- aiogram - импорт aiogram, общий для всех вариантов бота;
+- модули бота - import main после aiogram;
+- create_tables - проверка схемы и администраторов из ADMIN_ID;
+- диспетчер - run_dispatcher до вызова receive (start_polling);
+- до приёма - сумма этапов.
+
+Первым идёт import main на пустой базе, где ещё нет таблиц, затем
+--runs запусков на базе с готовой схемой. ADMIN_ID содержит --admins
+id, как у бота с многими администраторами. Печатаются медианы.
+
+    python benchmarks/bench_startup.py [--runs 5] [--admins 100]
+"""
+
+import argparse
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = ("aiogram", "модули бота", "create_tables", "диспетчер")
+
+
+def child(full: bool) -> None:
+    """Замер в этом процессе, печатает JSON с длительностью этапов"""
+    sys.path.insert(0, ROOT)
+    times = [time.perf_counter()]
+    importlib.import_module("aiogram.methods")
+    times.append(time.perf_counter())
+    import main
+    times.append(time.perf_counter())
+
+    if full:
+        import asyncio
+
+        async def receive(dp, bot) -> None:
+            # Диспетчер собран, дальше был бы start_polling
+            times.append(time.perf_counter())
+
+        main.create_tables()
+        times.append(time.perf_counter())
+        asyncio.run(main.run_dispatcher(main.create_bot(), receive))
+    print(json.dumps(
+        dict(zip(STAGES, (end - start for start, end in zip(times, times[1:]))))
+    ))
+
+
+def measure(full: bool, env: dict) -> dict:
+    """Этапы одного запуска, пустой словарь - процесс упал"""
+    args = [sys.executable, __file__, "--child"] + (["--full"] if full else [])
+    result = subprocess.run(
+        args, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    if result.returncode != 0:
+        return {}
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def schema(env: dict) -> None:
+    """Создаёт схему, не импортируя обработчики"""
+    subprocess.run(
+        [sys.executable, "-c", "from models import create_tables; create_tables()"],
+        env=env, cwd=ROOT, check=True,
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--admins", type=int, default=100)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--full", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if args.child:
+        child(args.full)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DB_PATH=os.path.join(tmp, "bench.db"),
+            FSM_DB_PATH=os.path.join(tmp, "fsm.db"),
+            BOT_TOKEN="1:bench",
+            ADMIN_ID=" ".join(str(10_000 + i) for i in range(args.admins)),
+            BOT_WORKERS="0",
+        )
+        env.pop("DATABASE_URL", None)
+        env.pop("METRICS_PORT", None)
+
+        empty = measure(False, env)
+        schema(env)
+        runs = [measure(True, env) for _ in range(args.runs)]
+
+    print(f"Администраторов: {args.admins}, запусков: {args.runs}")
+    if empty:
+        print(f"import main на пустой базе: {empty['модули бота'] * 1000:.1f} мс")
+    else:
+        print("import main на пустой базе: ошибка")
+    if not all(runs):
+        print("Запуск на готовой базе: ошибка")
+        return
+    for stage in STAGES + ("до приёма",):
+        times = [
+            sum(run.values()) if stage == "до приёма" else run[stage]
+            for run in runs
+        ]
+        print(f"{stage:14} {statistics.median(times) * 1000:9.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Задержка от обновления до ответа: long polling против вебхука
+
+Бот с настоящими роутерами работает против поддельного Bot API,
+на каждое обновление /get_id меряется время до sendMessage.
+
+    python benchmarks/bench_webhook.py [число обновлений]
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import create_tables, db  # noqa: E402
+
+
+SECRET = "bench-secret"
+
+
+async def measure(api, send, count: int) -> list:
+    latencies = []
+    for i in range(count):
+        chat_id = 1000 + i
+        update = api.message_update(chat_id, "/get_id")
+        reply = api.wait_reply(chat_id)
+        started = time.perf_counter()
+        await send(update)
+        await asyncio.wait_for(reply, 10)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def report(name: str, latencies: list) -> None:
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+    print(f"{name:8} p50 {p50:7.2f} мс  p95 {p95:7.2f} мс")
+
+
+async def polling(dp, count: int) -> list:
+    from benchmarks.fake_api import FakeBotAPI
+
+    api = FakeBotAPI()
+    await api.start()
+    bot = api.make_bot()
+    task = asyncio.create_task(
+        dp.start_polling(bot, polling_timeout=30, handle_signals=False)
+    )
+
+    async def send(update):
+        api.push_update(update)
+
+    await measure(api, send, 5)
+    latencies = await measure(api, send, count)
+    await dp.stop_polling()
+    await task
+    await api.close()
+    return latencies
+
+
+async def webhook(dp, count: int) -> list:
+    from aiohttp import web
+    from benchmarks.fake_api import FakeBotAPI
+    from webhook import create_app
+
+    api = FakeBotAPI()
+    await api.start()
+    bot = api.make_bot()
+    runner = web.AppRunner(create_app(dp, bot, secret=SECRET))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/webhook"
+
+    async with aiohttp.ClientSession() as session:
+        async def send(update):
+            async with session.post(
+                url,
+                json=update,
+                headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+            ) as response:
+                response.raise_for_status()
+
+        await measure(api, send, 5)
+        latencies = await measure(api, send, count)
+
+    await runner.cleanup()
+    await api.close()
+    return latencies
+
+
+async def main(count: int) -> None:
+    # Роутеры - синглтоны модулей, их можно подключить только один раз
+    from aiogram import Dispatcher
+    from handlers import add_routers
+
+    dp = Dispatcher()
+    add_routers(dp)
+    report("polling", await polling(dp, count))
+    report("webhook", await webhook(dp, count))
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        db.init(os.path.join(tmp, "bench.db"))
+        os.environ.setdefault("ADMIN_ID", "1")
+        create_tables()
+        asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
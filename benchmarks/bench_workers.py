@@ -0,0 +1,112 @@
+"""Пропускная способность при обработке в нескольких процессах
+
+Главный процесс принимает обновления long polling с поддельного
+Bot API и раздаёт их BOT_WORKERS процессам, как при запуске main.py.
+Нагрузка - «Список помещений» от администраторов с тысячами
+помещений: запрос страницы, сборка клавиатуры и разбор ответа.
+Для каждого числа процессов печатается число обновлений в секунду.
+Рост с числом процессов ограничен числом ядер машины.
+
+    python benchmarks/bench_workers.py [обновлений] [процессы ...]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Процессы-обработчики читают настройки из окружения. Модуль заново
+# импортируется в каждом из них, поэтому каталог создаётся один раз
+if "BENCH_WORKERS_DIR" not in os.environ:
+    os.environ["BENCH_WORKERS_DIR"] = tempfile.mkdtemp(prefix="bench-workers-")
+TMP = os.environ["BENCH_WORKERS_DIR"]
+os.environ["DB_PATH"] = os.path.join(TMP, "bench.db")
+os.environ["FSM_DB_PATH"] = os.path.join(TMP, "fsm.db")
+os.environ["BOT_TOKEN"] = "1:bench"
+os.environ.setdefault("ADMIN_ID", "1")
+os.environ["SENDER_GLOBAL_RATE"] = "1000000"
+os.environ["SENDER_CHAT_RATE"] = "1000000"
+os.environ.pop("METRICS_PORT", None)
+
+from models import Role, Room, User, UserRole, create_tables, db  # noqa: E402
+
+
+ADMINS = 200
+ROOMS_PER_ADMIN = 200
+FIRST_ADMIN = 10_000
+
+
+def seed() -> None:
+    admin = Role.get(name="Администратор")
+    admins = [FIRST_ADMIN + i for i in range(ADMINS)]
+    with db.atomic():
+        User.insert_many([(i,) for i in admins], fields=[User.id]).execute()
+        UserRole.insert_many(
+            [(i, admin.id) for i in admins],
+            fields=[UserRole.user, UserRole.role],
+        ).execute()
+        for admin_id in admins:
+            Room.insert_many(
+                [(f"Помещение {n}", admin_id) for n in range(ROOMS_PER_ADMIN)],
+                fields=[Room.name, Room.creator],
+            ).execute()
+
+
+async def run(workers: int, count: int) -> float:
+    from benchmarks.fake_api import FakeBotAPI
+    from workers import run_intake
+
+    api = FakeBotAPI()
+    await api.start()
+    os.environ["BOT_API_URL"] = api.url
+    bot = api.make_bot()
+
+    dispatchers = []
+
+    async def receive(dp, bot):
+        dispatchers.append(dp)
+        await dp.start_polling(bot, polling_timeout=1, handle_signals=False)
+
+    intake = asyncio.create_task(run_intake(bot, workers, receive))
+
+    async def wait_replies(target: int) -> None:
+        while api.calls["sendMessage"] < target:
+            await asyncio.sleep(0.01)
+
+    # Прогрев: каждый процесс запустился и ответил
+    for i in range(ADMINS):
+        api.push_update(api.message_update(FIRST_ADMIN + i, "/get_id"))
+    await asyncio.wait_for(wait_replies(ADMINS), 120)
+
+    started = time.perf_counter()
+    for i in range(count):
+        api.push_update(
+            api.message_update(FIRST_ADMIN + i % ADMINS, "Список помещений")
+        )
+    await wait_replies(ADMINS + count)
+    elapsed = time.perf_counter() - started
+
+    await dispatchers[0].stop_polling()
+    await intake
+    await bot.session.close()
+    await api.close()
+    return count / elapsed
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    counts = [int(arg) for arg in sys.argv[2:]] or [1, 2, 4]
+    create_tables()
+    seed()
+    print(f"Ядер: {os.cpu_count()}, обновлений: {count}")
+    for workers in counts:
+        rate = asyncio.run(run(workers, count))
+        print(f"процессов {workers:2}  {rate:9.1f} обн/с")
+
+
+if __name__ == "__main__":
+    main()
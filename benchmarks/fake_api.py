@@ -0,0 +1,167 @@
+"""Поддельный сервер Bot API для локальных замеров
+
+Отдаёт обновления через getUpdates, принимает вызовы методов и
+сообщает о каждом ответе бота, чтобы можно было мерить задержку от
+обновления до ответа.
+"""
+
+import asyncio
+import itertools
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import web
+
+
+BOT_USER = {
+    "id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot",
+}
+
+# Методы, результатом которых является сообщение
+MESSAGE_METHODS = {
+    "sendMessage", "sendPhoto", "sendDocument", "editMessageText",
+    "editMessageReplyMarkup",
+}
+
+
+class FakeBotAPI:
+    """Сервер Bot API в памяти"""
+
+    def __init__(self, latency: float = 0) -> None:
+        self.latency = latency
+        self.updates: asyncio.Queue = asyncio.Queue()
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.calls: Counter = Counter()
+        self.call_latency: Dict[str, List[float]] = defaultdict(list)
+        self.waiters: Dict[int, List[asyncio.Future]] = defaultdict(list)
+        self.runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    async def start(self, port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self.url
+
+    async def close(self) -> None:
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    def make_bot(self) -> Bot:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(self.url))
+        return Bot(token="1:bench", session=session)
+
+    # Обновления
+
+    def message_update(
+        self, chat_id: int, text: str, **message: Any
+    ) -> Dict[str, Any]:
+        return {
+            "update_id": next(self.update_ids),
+            "message": {
+                "message_id": next(self.message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "u"},
+                "text": text,
+                **message,
+            },
+        }
+
+    def callback_update(
+        self, chat_id: int, data: str, message_id: int = 1
+    ) -> Dict[str, Any]:
+        return {
+            "update_id": next(self.update_ids),
+            "callback_query": {
+                "id": str(next(self.update_ids)),
+                "chat_instance": "bench",
+                "from": {"id": chat_id, "is_bot": False, "first_name": "u"},
+                "data": data,
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "from": BOT_USER,
+                    "text": "menu",
+                },
+            },
+        }
+
+    def push_update(self, update: Dict[str, Any]) -> None:
+        self.updates.put_nowait(update)
+
+    def wait_reply(self, chat_id: int) -> asyncio.Future:
+        """Future, которое завершится следующим ответом бота в чат"""
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[chat_id].append(future)
+        return future
+
+    # Методы API
+
+    async def handle(self, request: web.Request) -> web.Response:
+        started = time.perf_counter()
+        method = request.match_info["method"]
+        data = dict(await request.post())
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == "getUpdates":
+            result = await self.get_updates(float(data.get("timeout") or 0))
+        elif method == "getMe":
+            result = BOT_USER
+        elif method in MESSAGE_METHODS:
+            result = self.reply(method, data)
+        else:
+            result = True
+
+        self.call_latency[method].append(time.perf_counter() - started)
+        return web.json_response({"ok": True, "result": result})
+
+    async def get_updates(self, timeout: float) -> List[Dict[str, Any]]:
+        updates = []
+        try:
+            updates.append(
+                await asyncio.wait_for(self.updates.get(), timeout or 0.01)
+            )
+        except asyncio.TimeoutError:
+            return updates
+        while not self.updates.empty() and len(updates) < 100:
+            updates.append(self.updates.get_nowait())
+        return updates
+
+    def reply(self, method: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        chat_id = int(data.get("chat_id") or 0)
+        for future in self.waiters.pop(chat_id, []):
+            if not future.done():
+                future.set_result(method)
+        message = {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": str(data.get("text", "")),
+        }
+        if method == "sendPhoto":
+            message["photo"] = [{
+                "file_id": f"photo{message['message_id']}",
+                "file_unique_id": f"u{message['message_id']}",
+                "width": 330, "height": 330,
+            }]
+        if method == "sendDocument":
+            message["document"] = {
+                "file_id": f"doc{message['message_id']}",
+                "file_unique_id": f"u{message['message_id']}",
+            }
+        return message
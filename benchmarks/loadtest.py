@@ -0,0 +1,291 @@
+"""Нагрузочный тест бота на поддельном Bot API
+
+Синтетические обновления прогоняются через настоящие роутеры из
+handlers.add_routers на временной базе SQLite. Сценарии:
+
+- scan - переход по QR-коду /start room_<id>;
+- appeal - QR-код и обращение в помещения с 0, 10 и 40 подписчиками;
+- list_rooms - «Список помещений» у администратора с тысячами помещений;
+- notify_wizard, answer_wizard - мастера подписчиков и ответов.
+
+Для каждого сценария печатаются обновления в секунду, p50/p95/p99
+задержки и число запросов к Bot API на сессию. --save сохраняет
+результат как базовый, --compare сравнивает с сохранённым и
+завершается с ошибкой при регрессии.
+
+    python benchmarks/loadtest.py --sessions 500 --compare
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Поддельный API не ограничивает частоту: снимаем лимиты рассылки и
+# обращений, чтобы мерить обработку, а не ожидание токенов
+os.environ.setdefault("ADMIN_ID", "1")
+os.environ.setdefault("SENDER_GLOBAL_RATE", "1000000")
+os.environ.setdefault("SENDER_CHAT_RATE", "1000000")
+os.environ.setdefault("THROTTLE_USER_PER_MINUTE", "1000000")
+os.environ.setdefault("THROTTLE_ROOM_PER_MINUTE", "1000000")
+os.environ.pop("METRICS_PORT", None)
+
+from callbacks import (  # noqa: E402
+    AnswerDone, AnswerRoom, NotifyDone, NotifyRoom,
+)
+from models import (  # noqa: E402
+    Notify, Role, Room, User, UserRole, create_tables, db,
+)
+
+
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baseline.json")
+LIST_ROOMS = 3000
+WIZARD_ROOMS = 20
+SUBSCRIBERS = (0, 10, 40)
+FIRST_USER = 100_000
+FIRST_ADMIN = 10_000
+
+
+def seed(sessions: int) -> Dict[str, list]:
+    """Заполняет базу и возвращает id помещений по назначению"""
+    admin = Role.get(name="Администратор")
+    users = [FIRST_USER + i for i in range(max(SUBSCRIBERS) + sessions)]
+    admins = [FIRST_ADMIN + i for i in range(sessions)]
+    with db.atomic():
+        for batch in range(0, len(users + admins), 500):
+            User.insert_many(
+                [(user_id,) for user_id in (users + admins)[batch:batch + 500]],
+                fields=[User.id],
+            ).on_conflict_ignore().execute()
+        UserRole.insert_many(
+            [(admin_id, admin.id) for admin_id in admins],
+            fields=[UserRole.user, UserRole.role],
+        ).execute()
+
+        Room.insert_many(
+            [(f"Помещение {i}", 1) for i in range(LIST_ROOMS)],
+            fields=[Room.name, Room.creator],
+        ).execute()
+
+        appeal_rooms = []
+        for count in SUBSCRIBERS:
+            room = Room.create(name=f"Подписчиков {count}", creator=1)
+            Notify.insert_many(
+                [(room.id, user_id) for user_id in users[:count]],
+                fields=[Notify.room, Notify.user],
+            ).execute()
+            appeal_rooms.append(room.id)
+
+        wizard_rooms = {}
+        for admin_id in admins:
+            Room.insert_many(
+                [(f"Аудитория {i}", admin_id) for i in range(WIZARD_ROOMS)],
+                fields=[Room.name, Room.creator],
+            ).execute()
+            wizard_rooms[admin_id] = [
+                room.id for room in Room.get_active_by_user(admin_id)
+            ]
+    return {
+        "appeal_rooms": appeal_rooms,
+        "wizard_rooms": wizard_rooms,
+        "users": users,
+    }
+
+
+# Сценарии: функция (api, номер сессии, данные) -> список обновлений
+
+def scan(api, i: int, data) -> List[dict]:
+    room_id = random.choice(data["appeal_rooms"])
+    return [api.message_update(FIRST_USER + i, f"/start room_{room_id}")]
+
+
+def appeal(api, i: int, data) -> List[dict]:
+    room_id = data["appeal_rooms"][i % len(SUBSCRIBERS)]
+    chat_id = 1_000_000 + i
+    return [
+        api.message_update(chat_id, f"/start room_{room_id}"),
+        api.message_update(chat_id, f"Обращение номер {i}"),
+    ]
+
+
+def list_rooms(api, i: int, data) -> List[dict]:
+    return [api.message_update(1, "Список помещений")]
+
+
+def notify_wizard(api, i: int, data) -> List[dict]:
+    admin_id = FIRST_ADMIN + i
+    rooms = data["wizard_rooms"][admin_id]
+    return (
+        [api.message_update(admin_id, "Назначить ответственных")]
+        + [api.callback_update(admin_id, NotifyRoom(room_id=room_id).pack())
+           for room_id in rooms[:5]]
+        + [api.message_update(admin_id, str(user_id))
+           for user_id in data["users"][:3]]
+        + [api.callback_update(admin_id, NotifyDone().pack())]
+    )
+
+
+def answer_wizard(api, i: int, data) -> List[dict]:
+    admin_id = FIRST_ADMIN + i
+    rooms = data["wizard_rooms"][admin_id]
+    return (
+        [api.message_update(admin_id, "Добавить ответы")]
+        + [api.callback_update(admin_id, AnswerRoom(room_id=room_id).pack())
+           for room_id in rooms[5:10]]
+        + [api.message_update(admin_id, f"Ответ {n}") for n in range(3)]
+        + [api.callback_update(admin_id, AnswerDone().pack())]
+    )
+
+
+SCENARIOS: Dict[str, Callable] = {
+    "scan": scan,
+    "appeal": appeal,
+    "list_rooms": list_rooms,
+    "notify_wizard": notify_wizard,
+    "answer_wizard": answer_wizard,
+}
+
+
+def percentile(values: List[float], p: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run_scenario(
+    dp, bot, api, name: str, sessions: int, concurrency: int, data
+) -> Dict[str, float]:
+    from aiogram.types import Update
+    from sender import SENDER
+    from wizard import WIZARD
+
+    build = SCENARIOS[name]
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def session(i: int) -> None:
+        async with semaphore:
+            # Обновления одной сессии идут по порядку, как от одного чата
+            for raw in build(api, i, data):
+                update = Update.model_validate(raw, context={"bot": bot})
+                started = time.perf_counter()
+                await dp.feed_update(bot, update)
+                latencies.append(time.perf_counter() - started)
+
+    calls = sum(api.calls.values())
+    started = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - started
+    # Рассылка и отложенные правки мастеров - тоже запросы сессий
+    await SENDER.join()
+    await WIZARD.close()
+
+    latencies.sort()
+    return {
+        "updates_per_sec": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "api_calls": (sum(api.calls.values()) - calls) / sessions,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """Печатает отличия от базового прогона, True - регрессий нет"""
+    ok = True
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric, value in result.items():
+            old = base.get(metric)
+            if old is None:
+                continue
+            # Для пропускной способности хуже - меньше, для задержек - больше
+            change = (value - old) / old if old else 0
+            worse = -change if metric == "updates_per_sec" else change
+            mark = "РЕГРЕССИЯ" if worse > tolerance else ""
+            ok = ok and not mark
+            print(f"  {name:14} {metric:16} {old:10.2f} -> {value:10.2f} "
+                  f"({change:+.0%}) {mark}")
+    return ok
+
+
+async def main(args) -> bool:
+    from aiogram import Dispatcher
+    from benchmarks.fake_api import FakeBotAPI
+    from handlers import add_routers
+    from sender import SENDER
+
+    data = seed(args.sessions)
+    api = FakeBotAPI(latency=args.api_latency / 1000)
+    await api.start()
+    bot = api.make_bot()
+    dp = Dispatcher()
+    add_routers(dp)
+    SENDER.start(bot)
+
+    results = {}
+    for name in args.scenario:
+        results[name] = await run_scenario(
+            dp, bot, api, name, args.sessions, args.concurrency, data
+        )
+        result = results[name]
+        print(
+            f"{name:14} {result['updates_per_sec']:9.1f} обн/с  "
+            f"p50 {result['p50_ms']:7.2f}  p95 {result['p95_ms']:7.2f}  "
+            f"p99 {result['p99_ms']:7.2f} мс  "
+            f"API {result['api_calls']:5.1f}/сессию"
+        )
+
+    await SENDER.close()
+    await bot.session.close()
+    await api.close()
+
+    ok = True
+    if args.compare and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            print("Сравнение с базовым прогоном:")
+            ok = compare(results, json.load(f), args.tolerance)
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return ok
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scenario", nargs="+", choices=list(SCENARIOS),
+        default=list(SCENARIOS),
+    )
+    parser.add_argument("--sessions", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument(
+        "--api-latency", type=float, default=0,
+        help="задержка ответа поддельного API, мс",
+    )
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2,
+        help="допустимое ухудшение, доля",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        db.init(os.path.join(tmp, "loadtest.db"))
+        create_tables()
+        passed = asyncio.run(main(arguments))
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,183 @@
+"""Данные inline-кнопок
+
+У каждого действия своя фабрика CallbackData с коротким уникальным
+префиксом. CallbackDataMiddleware один раз разбирает callback_data по
+префиксу через словарь FACTORIES, а фильтр Is только сравнивает тип
+уже разобранных данных. Обработчики по-прежнему перебирает роутер
+aiogram по порядку регистрации, но каждая проверка - сравнение типа,
+без повторного разбора строки.
+
+    @router.callback_query(Is(RoomInfo))
+    async def handler(callback: CallbackQuery, callback_data: RoomInfo):
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Optional, Type, TypeVar
+
+from aiogram import BaseMiddleware
+from aiogram.filters import Filter
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery
+
+
+# Префикс -> фабрика
+FACTORIES: Dict[str, Type[CallbackData]] = {}
+
+T = TypeVar("T", bound=Type[CallbackData])
+
+
+def register(factory: T) -> T:
+    if factory.__prefix__ in FACTORIES:
+        raise ValueError(f"Префикс {factory.__prefix__!r} уже занят")
+    FACTORIES[factory.__prefix__] = factory
+    return factory
+
+
+# Помещения
+
+@register
+class RoomsPage(CallbackData, prefix="rp"):
+    """Страница списка помещений, direction: n - вперёд, p - назад"""
+    direction: str
+    room_id: int
+
+
+@register
+class RoomInfo(CallbackData, prefix="ri"):
+    room_id: int
+
+
+@register
+class RoomAppeals(CallbackData, prefix="ra"):
+    room_id: int
+
+
+@register
+class RoomAnswers(CallbackData, prefix="rs"):
+    room_id: int
+
+
+@register
+class RoomQR(CallbackData, prefix="rq"):
+    room_id: int
+
+
+@register
+class RoomDelete(CallbackData, prefix="rd"):
+    room_id: int
+
+
+@register
+class RoomDeleteConfirm(CallbackData, prefix="ry"):
+    room_id: int
+
+
+@register
+class RoomDeleteCancel(CallbackData, prefix="rn"):
+    room_id: int
+
+
+@register
+class AnswerMenu(CallbackData, prefix="am"):
+    answer_id: int
+
+
+# Обращения
+
+@register
+class AppealsPage(CallbackData, prefix="ap"):
+    """Страница обращений, курсор - (created_at, id) крайнего обращения"""
+    direction: str
+    room_id: int
+    created_at: str
+    appeal_id: int
+
+
+@register
+class SearchPage(CallbackData, prefix="sp"):
+    offset: int
+
+
+# Мастер подписчиков
+
+@register
+class NotifyRoom(CallbackData, prefix="nr"):
+    room_id: int
+
+
+@register
+class NotifyPage(CallbackData, prefix="np"):
+    page: int
+
+
+@register
+class NotifyRemoveUser(CallbackData, prefix="nx"):
+    user_id: int
+
+
+@register
+class NotifyDone(CallbackData, prefix="nf"):
+    pass
+
+
+# Мастер ответов
+
+@register
+class AnswerRoom(CallbackData, prefix="wr"):
+    room_id: int
+
+
+@register
+class AnswerPage(CallbackData, prefix="wp"):
+    page: int
+
+
+@register
+class AnswerRemove(CallbackData, prefix="wx"):
+    index: int
+
+
+@register
+class AnswerDone(CallbackData, prefix="wf"):
+    pass
+
+
+def parse(data: Optional[str]) -> Optional[CallbackData]:
+    """Разбирает callback_data, None - не наш формат"""
+    if not data:
+        return None
+    factory = FACTORIES.get(data.split(":", 1)[0])
+    if factory is None:
+        return None
+    try:
+        return factory.unpack(data)
+    except (TypeError, ValueError):
+        return None
+
+
+class CallbackDataMiddleware(BaseMiddleware):
+    """Внешний middleware: разобранные данные кнопки в data["callback_data"]"""
+
+    async def __call__(
+        self,
+        handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any],
+    ) -> Any:
+        callback_data = parse(event.data)
+        if callback_data is not None:
+            data["callback_data"] = callback_data
+        return await handler(event, data)
+
+
+class Is(Filter):
+    """Нажата кнопка фабрики factory"""
+
+    def __init__(self, factory: Type[CallbackData]) -> None:
+        self.factory = factory
+
+    async def __call__(
+        self,
+        callback: CallbackQuery,
+        callback_data: Optional[CallbackData] = None,
+    ) -> bool:
+        return type(callback_data) is self.factory
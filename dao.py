@@ -0,0 +1,875 @@
+"""Асинхронный доступ к базе данных
+
+Запросы peewee выполняются в отдельном пуле потоков, у каждого потока
+своё соединение с БД, поэтому медленная запись или ожидание блокировки
+SQLite не останавливает цикл событий и обработку других обновлений.
+Функции возвращают готовые данные, чтобы в обработчиках не было
+ленивых запросов по внешним ключам.
+"""
+
+import asyncio
+import contextvars
+import functools
+import itertools
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import (
+    IO, Awaitable, Callable, Dict, FrozenSet, Iterable, List, NamedTuple,
+    Optional, Set, Tuple, TypeVar
+)
+
+from aiogram.types import ReplyKeyboardMarkup
+from dotenv import load_dotenv
+from peewee import SQL, Expression, Tuple as Row, Value, chunked, fn
+from playhouse.postgres_ext import TS_MATCH
+
+from keyboards import get_menu_by_room
+from models import (
+    APPEAL_SEARCH_CONFIG, IS_SQLITE, Answer, AnswerStat, Appeal, AppealIndex,
+    AppealStat, ArchivedAppeal, ArchivedAppealIndex, Notify, Role, Room,
+    RoomDigest, User, UserRole, db, write_transaction
+)
+
+
+T = TypeVar("T")
+
+load_dotenv()
+
+
+def _connect() -> None:
+    """Открывает соединение потока пула
+
+    Соединение SQLite поток держит всё время. Соединение PostgreSQL
+    берётся из пула на время вызова (_call), чтобы пул мог заменить
+    разорванные и простаивавшие дольше DB_STALE_TIMEOUT соединения.
+    """
+    if IS_SQLITE:
+        db.connect(reuse_if_open=True)
+
+
+def _call(func: Callable[..., T], *args, **kwargs) -> T:
+    if IS_SQLITE:
+        return func(*args, **kwargs)
+    with db.connection_context():
+        return func(*args, **kwargs)
+
+
+EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("DB_WORKERS", "4")),
+    thread_name_prefix="db",
+    initializer=_connect,
+)
+# Выгрузки идут минуты и занимали бы потоки EXECUTOR, поэтому у них
+# свои потоки и соединения. Лишние выгрузки ждут в очереди пула
+EXPORT_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("EXPORT_WORKERS", "1")),
+    thread_name_prefix="export",
+    initializer=_connect,
+)
+
+
+async def _run_in(
+    executor: ThreadPoolExecutor, func: Callable[..., T], *args, **kwargs
+) -> T:
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        executor, functools.partial(context.run, _call, func, *args, **kwargs)
+    )
+
+
+async def run(func: Callable[..., T], *args, **kwargs) -> T:
+    """Выполняет синхронную функцию с запросами в пуле БД
+
+    Функция видит contextvars вызывающей задачи (например, метрики
+    текущего обновления).
+    """
+    return await _run_in(EXECUTOR, func, *args, **kwargs)
+
+
+def in_executor(func: Callable[..., T]) -> Callable[..., Awaitable[T]]:
+    """Делает из синхронной функции с запросами awaitable
+
+    Исходная функция доступна через ``__wrapped__``.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run(func, *args, **kwargs)
+
+    return wrapper
+
+
+# Пользователи и роли
+
+@in_executor
+def get_user(user_id: int) -> Optional[User]:
+    return User.get_or_none(id=user_id)
+
+
+@in_executor
+def get_user_roles() -> Dict[int, FrozenSet[str]]:
+    """Роли всех пользователей, у которых они есть"""
+    roles: Dict[int, set] = {}
+    query = UserRole.select(UserRole.user, Role.name).join(Role).tuples()
+    for user_id, role_name in query:
+        roles.setdefault(user_id, set()).add(role_name)
+    return {user_id: frozenset(names) for user_id, names in roles.items()}
+
+
+# Сбросы кэшей для других процессов-обработчиков (workers.py):
+# слушатель получает имя кэша и ключи. Может вызываться из потоков
+# пула БД
+INVALIDATION_LISTENERS: List[Callable[[str, Tuple[int, ...]], None]] = []
+
+
+def _publish(cache: str, keys: Tuple[int, ...]) -> None:
+    for listener in INVALIDATION_LISTENERS:
+        listener(cache, keys)
+
+
+class RoleCache:
+    """Общий для всех роутеров кэш ролей: user_id -> названия ролей
+
+    Загружается одним запросом целиком, поэтому пользователи без ролей
+    не стоят ни одного запроса. Сбрасывается по TTL и при выдаче ролей.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self.roles: Optional[Dict[int, FrozenSet[str]]] = None
+        self.loaded_at = 0.0
+        self.version = 0
+        self.lock = asyncio.Lock()
+
+    def is_stale(self) -> bool:
+        return (
+            self.roles is None
+            or time.monotonic() - self.loaded_at > self.ttl
+        )
+
+    def invalidate(self) -> None:
+        self.drop()
+        _publish("roles", ())
+
+    def drop(self, *keys: int) -> None:
+        """Сброс без оповещения других процессов"""
+        self.roles = None
+        self.version += 1
+
+    async def get(self, user_id: int) -> FrozenSet[str]:
+        if self.is_stale():
+            async with self.lock:
+                if self.is_stale():
+                    version, loaded_at = self.version, time.monotonic()
+                    roles = await get_user_roles()
+                    # Во время загрузки роли могли выдать, тогда
+                    # результат используем только для этого запроса
+                    if version != self.version:
+                        return roles.get(user_id, frozenset())
+                    self.roles, self.loaded_at = roles, loaded_at
+        return self.roles.get(user_id, frozenset())
+
+
+ROLES = RoleCache(ttl=float(os.getenv("ROLE_CACHE_TTL", "60")))
+
+
+async def has_role(user_id: int, role_name: str) -> bool:
+    """Есть ли у пользователя роль"""
+    return role_name in await ROLES.get(user_id)
+
+
+def _add_users(user_ids: Iterable[int]) -> None:
+    """Заводит пользователей, которых ещё нет в User
+
+    Строка User появляется только у администраторов из ADMIN_ID, а
+    подписчики, авторы обращений и сотрудники ссылаются на User внешним
+    ключом. SQLite внешние ключи по умолчанию не проверяет, PostgreSQL
+    без строки отклонит запись.
+    """
+    for batch in chunked([(user_id,) for user_id in set(user_ids)], 500):
+        User.insert_many(batch, fields=[User.id]).on_conflict_ignore().execute()
+
+
+# Пользователи, уже заведённые этим процессом: /start не пишет в БД
+# при каждом сканировании QR-кода
+STARTED_USERS: Set[int] = set()
+
+
+async def add_user(user_id: int) -> None:
+    """Заводит пользователя, запустившего бота"""
+    if user_id in STARTED_USERS:
+        return
+    await run(_add_users, [user_id])
+    STARTED_USERS.add(user_id)
+
+
+@in_executor
+def _add_role(user_id: int, role_name: str) -> bool:
+    _add_users([user_id])
+    _, created = UserRole.get_or_create(
+        user=user_id, role=Role.get(name=role_name)
+    )
+    return created
+
+
+async def add_role(user_id: int, role_name: str) -> bool:
+    """Выдаёт роль пользователю, возвращает True если роль новая"""
+    created = await _add_role(user_id, role_name)
+    ROLES.invalidate()
+    return created
+
+
+# Помещения
+
+@in_executor
+def get_room(room_id: int) -> Optional[Room]:
+    return Room.get_or_none(id=room_id)
+
+
+@in_executor
+def get_active_rooms(user_id: int) -> List[Room]:
+    return Room.get_active_by_user(user_id=user_id)
+
+
+class Page(NamedTuple):
+    """Страница выборки по ключу (keyset)"""
+    items: list
+    has_prev: bool
+    has_next: bool
+
+
+def _page(query, order, before: bool, limit: int, cursor_given: bool) -> Page:
+    """Выполняет запрос страницы одним запросом с limit + 1 строкой
+
+    before - страница перед курсором: выбираем в обратном порядке и
+    разворачиваем.
+    """
+    rows = list(query.order_by(*order).limit(limit + 1))
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before:
+        return Page(rows[::-1], has_more, True)
+    return Page(rows, cursor_given, has_more)
+
+
+@in_executor
+def get_rooms_page(
+    user_id: int,
+    after: Optional[int] = None,
+    before: Optional[int] = None,
+    limit: int = 15,
+) -> Page:
+    """Страница активных помещений по возрастанию id"""
+    query = Room.select(Room.id, Room.name).where(
+        (Room.creator == user_id) & (Room.is_archived == False)
+    )
+    if before is not None:
+        query = query.where(Room.id < before)
+        return _page(query, [Room.id.desc()], True, limit, True)
+    if after is not None:
+        query = query.where(Room.id > after)
+    return _page(query, [Room.id], False, limit, after is not None)
+
+
+@in_executor
+def create_room(name: str, creator_id: int) -> Room:
+    room = Room.create(name=name, creator=creator_id)
+    ROOM_NAMES.invalidate(creator_id)
+    return room
+
+
+@in_executor
+def archive_room(room_id: int) -> None:
+    Room.update(is_archived=True).where(Room.id == room_id).execute()
+    ROOMS.invalidate(room_id)
+    # Создатель помещения здесь неизвестен, архивация редкая
+    ROOM_NAMES.invalidate()
+
+
+class RoomNames(NamedTuple):
+    """Активные помещения администратора"""
+    # room_id -> название
+    names: Dict[int, str]
+    # id по возрастанию, для страниц
+    order: Tuple[int, ...]
+
+    def page(self, number: int, size: int) -> List[Tuple[int, str]]:
+        start = number * size
+        return [
+            (room_id, self.names[room_id])
+            for room_id in self.order[start:start + size]
+        ]
+
+
+@in_executor
+def get_room_names(user_id: int) -> RoomNames:
+    names = dict(
+        Room.select(Room.id, Room.name)
+        .where((Room.creator == user_id) & (Room.is_archived == False))
+        .order_by(Room.id)
+        .tuples()
+    )
+    return RoomNames(names, tuple(names))
+
+
+class RoomNameCache:
+    """Названия активных помещений: user_id -> RoomNames
+
+    Общий для мастеров подписчиков и ответов: в данных FSM мастера
+    хранятся только id выбранных помещений, названия для страницы и
+    итога берутся отсюда. Сбрасывается при создании и архивации
+    помещений и по TTL.
+    """
+
+    def __init__(self, ttl: float, max_size: int = 1000) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.rooms: Dict[int, Tuple[RoomNames, float]] = {}
+        self.generation = 0
+
+    def invalidate(self, *user_ids: int) -> None:
+        """Сбрасывает помещения пользователей, без аргументов - все"""
+        self.drop(*user_ids)
+        _publish("room_names", user_ids)
+
+    def drop(self, *user_ids: int) -> None:
+        """Сброс без оповещения других процессов"""
+        self.generation += 1
+        if not user_ids:
+            self.rooms = {}
+        for user_id in user_ids:
+            self.rooms.pop(user_id, None)
+
+    async def get(self, user_id: int) -> RoomNames:
+        cached = self.rooms.get(user_id)
+        if cached is not None and time.monotonic() - cached[1] < self.ttl:
+            return cached[0]
+
+        generation, loaded_at = self.generation, time.monotonic()
+        rooms = await get_room_names(user_id)
+        if generation == self.generation:
+            if len(self.rooms) >= self.max_size:
+                self.rooms.pop(next(iter(self.rooms)))
+            self.rooms[user_id] = (rooms, loaded_at)
+        return rooms
+
+
+ROOM_NAMES = RoomNameCache(ttl=float(os.getenv("ROOM_CACHE_TTL", "300")))
+
+
+# Ответы
+
+@in_executor
+def get_answers(room_id: int) -> List[Answer]:
+    return list(Answer.select().where(Answer.room == room_id))
+
+
+def _insert_new_pairs(model, first, second, pairs: List[tuple]) -> List[tuple]:
+    """Вставляет пары, которых ещё нет, одной транзакцией
+
+    Существующие пары выбираются одним запросом, новые вставляются
+    пачками insert_many. В SQLite транзакция сразу берёт блокировку
+    записи, поэтому между выборкой и вставкой пары не появятся, в
+    PostgreSQL одновременно вставленные пары пропустит on_conflict_ignore.
+    """
+    if not pairs:
+        return []
+    with write_transaction():
+        existing = set(
+            model.select(first, second)
+            .where(
+                first.in_({pair[0] for pair in pairs})
+                & second.in_({pair[1] for pair in pairs})
+            )
+            .tuples()
+        )
+        new = [pair for pair in dict.fromkeys(pairs) if pair not in existing]
+        for batch in chunked(new, 500):
+            model.insert_many(batch, fields=[first, second]) \
+                .on_conflict_ignore().execute()
+    return new
+
+
+@in_executor
+def add_answers(
+    room_ids: Iterable[int], answers: List[str]
+) -> List[Tuple[int, str]]:
+    """Добавляет ответы к помещениям, возвращает новые (room_id, text)"""
+    pairs = [(room_id, answer) for room_id in room_ids for answer in answers]
+    created = _insert_new_pairs(Answer, Answer.room, Answer.text, pairs)
+    ROOMS.invalidate(*{room_id for room_id, _ in created})
+    return created
+
+
+# Подписчики
+
+@in_executor
+def add_notifies(
+    room_ids: Iterable[int], user_ids: List[int]
+) -> List[Tuple[int, int]]:
+    """Подписывает пользователей на помещения, возвращает новые
+    (room_id, user_id)"""
+    pairs = [(room_id, user_id) for room_id in room_ids for user_id in user_ids]
+    _add_users(user_ids)
+    created = _insert_new_pairs(Notify, Notify.room, Notify.user, pairs)
+    ROOMS.invalidate(*{room_id for room_id, _ in created})
+    return created
+
+
+# Сводные рассылки
+
+@in_executor
+def set_digest(room_id: int, interval: int, threshold: int) -> None:
+    RoomDigest.insert(
+        room=room_id, interval=interval, threshold=threshold
+    ).on_conflict(
+        conflict_target=[RoomDigest.room],
+        update={
+            RoomDigest.interval: interval,
+            RoomDigest.threshold: threshold,
+        },
+    ).execute()
+    ROOMS.invalidate(room_id)
+
+
+@in_executor
+def delete_digest(room_id: int) -> None:
+    RoomDigest.delete().where(RoomDigest.room == room_id).execute()
+    ROOMS.invalidate(room_id)
+
+
+# Снимки помещений
+
+class RoomSnapshot(NamedTuple):
+    """Всё, что нужно пути «скан QR -> обращение», без запросов к БД"""
+    id: int
+    name: str
+    creator_id: int
+    answers: Tuple[str, ...]
+    menu: ReplyKeyboardMarkup
+    subscriber_ids: Tuple[int, ...]
+    # (interval, threshold) сводной рассылки или None
+    digest: Optional[Tuple[int, int]]
+
+
+@in_executor
+def load_room_snapshot(room_id: int) -> Optional[RoomSnapshot]:
+    room = Room.get_or_none((Room.id == room_id) & (Room.is_archived == False))
+    if room is None:
+        return None
+    answers = tuple(
+        text for text, in
+        Answer.select(Answer.text).where(Answer.room == room_id)
+        .order_by(Answer.id).tuples()
+    )
+    subscriber_ids = tuple(
+        user_id for user_id, in
+        Notify.select(Notify.user).where(Notify.room == room_id).tuples()
+    )
+    digest = (
+        RoomDigest.select(RoomDigest.interval, RoomDigest.threshold)
+        .where(RoomDigest.room == room_id).tuples().first()
+    )
+    return RoomSnapshot(
+        id=room.id,
+        name=room.name,
+        creator_id=room.creator_id,
+        answers=answers,
+        menu=get_menu_by_room(answers=list(answers)),
+        subscriber_ids=subscriber_ids,
+        digest=digest,
+    )
+
+
+class RoomCache:
+    """Снимки помещений: room_id -> RoomSnapshot
+
+    Сбрасывается точечно при архивации помещения, изменении его ответов,
+    подписчиков и сводной рассылки, в том числе другими обработчиками
+    через INVALIDATION_LISTENERS. TTL страхует от изменений в БД
+    в обход бота.
+    """
+
+    def __init__(self, ttl: float, max_size: int = 10_000) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.snapshots: Dict[int, Tuple[RoomSnapshot, float]] = {}
+        # Растёт при каждом сбросе: загрузка, начатая до сброса,
+        # не попадает в кэш
+        self.generation = 0
+
+    def invalidate(self, *room_ids: int) -> None:
+        # Вызывается и из потоков пула БД: операции над dict атомарны
+        self.drop(*room_ids)
+        if room_ids:
+            _publish("rooms", room_ids)
+
+    def drop(self, *room_ids: int) -> None:
+        """Сброс без оповещения других процессов"""
+        self.generation += 1
+        for room_id in room_ids:
+            self.snapshots.pop(room_id, None)
+
+    async def get(self, room_id: int) -> Optional[RoomSnapshot]:
+        cached = self.snapshots.get(room_id)
+        if cached is not None and time.monotonic() - cached[1] < self.ttl:
+            return cached[0]
+
+        generation, loaded_at = self.generation, time.monotonic()
+        snapshot = await load_room_snapshot(room_id)
+        if snapshot is not None and generation == self.generation:
+            if len(self.snapshots) >= self.max_size:
+                self.snapshots.pop(next(iter(self.snapshots)))
+            self.snapshots[room_id] = (snapshot, loaded_at)
+        return snapshot
+
+
+ROOMS = RoomCache(ttl=float(os.getenv("ROOM_CACHE_TTL", "300")))
+
+CACHES = {"roles": ROLES, "rooms": ROOMS, "room_names": ROOM_NAMES}
+
+
+def drop_cached(cache: str, keys: Iterable[int]) -> None:
+    """Применяет сброс кэша, сделанный другим процессом"""
+    CACHES[cache].drop(*keys)
+
+
+# Обращения
+
+@in_executor
+def create_appeal(
+    room_id: int, author_id: int, message: str, is_answer: bool = False
+) -> Appeal:
+    """Сохраняет обращение и увеличивает счётчики статистики
+
+    is_answer - текст совпадает с одним из вариантов ответа помещения.
+    Автор заводится в User в той же транзакции.
+    """
+    created_at = datetime.now().replace(microsecond=0)
+    with write_transaction():
+        _add_users([author_id])
+        appeal = Appeal.create(
+            room=room_id, author=author_id, message=message,
+            created_at=created_at,
+        )
+        hour = created_at.replace(minute=0, second=0)
+        AppealStat.insert_many(
+            [
+                (room_id, "hour", hour, 1),
+                (room_id, "day", hour.replace(hour=0), 1),
+            ],
+            fields=[
+                AppealStat.room, AppealStat.period, AppealStat.start,
+                AppealStat.count,
+            ],
+        ).on_conflict(
+            conflict_target=[AppealStat.room, AppealStat.period, AppealStat.start],
+            update={AppealStat.count: AppealStat.count + 1},
+        ).execute()
+        if is_answer:
+            AnswerStat.insert(room=room_id, text=message, count=1).on_conflict(
+                conflict_target=[AnswerStat.room, AnswerStat.text],
+                update={AnswerStat.count: AnswerStat.count + 1},
+            ).execute()
+    return appeal
+
+
+@in_executor
+def get_appeals_page(
+    room_id: int,
+    after: Optional[Tuple[datetime, int]] = None,
+    before: Optional[Tuple[datetime, int]] = None,
+    limit: int = 10,
+) -> Page:
+    """Страница обращений от новых к старым
+
+    Курсор - (created_at, id) обращения: after - более старые,
+    before - более новые. Порядок совпадает с индексом (room, created_at).
+    """
+    query = Appeal.select().where(Appeal.room == room_id)
+    key = Row(Appeal.created_at, Appeal.id)
+    if before is not None:
+        query = query.where(key > Row(*before))
+        return _page(
+            query, [Appeal.created_at, Appeal.id], True, limit, True
+        )
+    if after is not None:
+        query = query.where(key < Row(*after))
+    return _page(
+        query, [Appeal.created_at.desc(), Appeal.id.desc()], False, limit,
+        after is not None,
+    )
+
+
+EXPORT_CHUNK = 5000
+
+
+def _appeal_rows(
+    model,
+    user_id: int,
+    room_id: Optional[int],
+    since: Optional[datetime],
+    until: Optional[datetime],
+) -> Iterable[tuple]:
+    """Обращения (Appeal или ArchivedAppeal) помещений администратора
+    пачками по EXPORT_CHUNK строк
+
+    Порядок (room, created_at, id) совпадает с индексом таблиц, поэтому
+    SQLite не сортирует выборку. Каждая пачка - отдельная короткая
+    транзакция чтения от ключа последней строки: выгрузка не держит
+    одну транзакцию всё время и не мешает контрольным точкам WAL
+    SQLite и очистке старых версий строк в PostgreSQL.
+    """
+    query = (
+        model.select(
+            model.id, model.created_at, Room.name, model.author,
+            model.message, model.room,
+        )
+        .join(Room, on=(model.room == Room.id))
+        .where(Room.creator == user_id)
+    )
+    if room_id is not None:
+        query = query.where(model.room == room_id)
+    if since is not None:
+        query = query.where(model.created_at >= since)
+    if until is not None:
+        query = query.where(model.created_at < until)
+    query = query.order_by(model.room, model.created_at, model.id)
+    key = Row(model.room, model.created_at, model.id)
+
+    last = None
+    while True:
+        chunk = query if last is None else query.where(key > Row(*last))
+        with db.atomic():
+            rows = list(chunk.limit(EXPORT_CHUNK).tuples())
+        for row in rows:
+            yield row[:5]
+        if len(rows) < EXPORT_CHUNK:
+            return
+        appeal_id, created_at, *_, room = rows[-1]
+        last = (room, created_at, appeal_id)
+
+
+def _export_appeals(
+    out: IO[bytes],
+    writer: Callable[[Iterable[tuple], IO[bytes]], int],
+    user_id: int,
+    room_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> int:
+    return writer(
+        itertools.chain(
+            _appeal_rows(ArchivedAppeal, user_id, room_id, since, until),
+            _appeal_rows(Appeal, user_id, room_id, since, until),
+        ),
+        out,
+    )
+
+
+async def export_appeals(
+    out: IO[bytes],
+    writer: Callable[[Iterable[tuple], IO[bytes]], int],
+    user_id: int,
+    room_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> int:
+    """Пишет обращения в out функцией writer, возвращает их число
+
+    Запрос и запись выполняются в потоке EXPORT_EXECUTOR, строки идут
+    из курсора сразу в буфер. Сначала идут перенесённые в архив
+    обращения. Пачки читаются в разных транзакциях, поэтому
+    обращение, перенесённое в архив во время выгрузки, может в неё
+    не попасть.
+    """
+    return await _run_in(
+        EXPORT_EXECUTOR, _export_appeals, out, writer, user_id, room_id,
+        since, until,
+    )
+
+
+def fts_query(text: str) -> str:
+    """Запрос FTS5 из текста пользователя: все слова, по префиксу
+
+    Слова берутся в кавычки, поэтому операторы FTS5 в тексте не
+    ломают запрос. Префикс находит другие формы слова: «проектор»
+    найдёт и «проектора».
+    """
+    words = [word.replace('"', '""') for word in text.split()]
+    return " ".join(f'"{word}"*' for word in words if word)
+
+
+def tsquery(text: str) -> str:
+    """Запрос to_tsquery PostgreSQL из текста пользователя, как fts_query
+
+    Берутся только буквы и цифры, поэтому операторы tsquery в тексте
+    не ломают запрос.
+    """
+    return " & ".join(f"{word}:*" for word in re.findall(r"\w+", text))
+
+
+def _search_query(model, index, user_id: int, text: str):
+    """Обращения model (Appeal или ArchivedAppeal) по запросу с оценкой
+    score: чем меньше, тем релевантнее"""
+    if IS_SQLITE:
+        return (
+            index.select(
+                model.id, model.created_at, Room.name, model.message,
+                index.rank().alias("score"),
+            )
+            .join(model, on=(index.rowid == model.id))
+            .join(Room, on=(model.room == Room.id))
+            .where(index.match(fts_query(text)) & (Room.creator == user_id))
+        )
+    # Выражение должно совпадать с индексами из migrations
+    vector = fn.to_tsvector(APPEAL_SEARCH_CONFIG, model.message)
+    terms = fn.to_tsquery(APPEAL_SEARCH_CONFIG, tsquery(text))
+    return (
+        model.select(
+            model.id, model.created_at, Room.name, model.message,
+            (fn.ts_rank(vector, terms) * -1).alias("score"),
+        )
+        .join(Room, on=(model.room == Room.id))
+        .where(Expression(vector, TS_MATCH, terms) & (Room.creator == user_id))
+    )
+
+
+@in_executor
+def search_appeals(
+    user_id: int, text: str, offset: int = 0, limit: int = 10
+) -> Page:
+    """Обращения помещений администратора по релевантности
+
+    Ищет и в appeal, и в перенесённых в archivedappeal. SQLite ищет по
+    FTS5 (bm25), PostgreSQL - по GIN-индексам (ts_rank). Оценки двух
+    таблиц считаются по их собственной статистике слов, поэтому
+    порядок между ними приблизительный.
+    """
+    query = (
+        _search_query(Appeal, AppealIndex, user_id, text)
+        + _search_query(ArchivedAppeal, ArchivedAppealIndex, user_id, text)
+    ).order_by(SQL("score"))
+    rows = list(query.offset(offset).limit(limit + 1).namedtuples())
+    return Page(rows[:limit], offset > 0, len(rows) > limit)
+
+
+# Хранение обращений
+
+@in_executor
+def archive_appeals(cutoff: Optional[datetime], batch_size: int) -> int:
+    """Переносит пачку обращений в ArchivedAppeal, возвращает их число
+
+    Переносятся обращения архивных помещений и, если задан cutoff,
+    обращения старше него. Пачка - одна короткая транзакция, чтобы
+    запись обращений ботом не ждала долго. Перенесённые обращения
+    остаются в /search (archivedappeal_fts), /export и stats.py.
+    """
+    archived_rooms = Room.select(Room.id).where(Room.is_archived == True)
+    with write_transaction():
+        ids = [
+            appeal_id for appeal_id, in
+            Appeal.select(Appeal.id)
+            .where(Appeal.room.in_(archived_rooms))
+            .limit(batch_size)
+            .tuples()
+        ]
+        if cutoff is not None and len(ids) < batch_size:
+            # id растут вместе с created_at: старые обращения в начале
+            # таблицы, обход по id останавливается на первой пачке
+            ids += [
+                appeal_id for appeal_id, in
+                Appeal.select(Appeal.id)
+                .where(Appeal.created_at < cutoff)
+                .order_by(Appeal.id)
+                .limit(batch_size - len(ids))
+                .tuples()
+            ]
+        if not ids:
+            return 0
+        ArchivedAppeal.insert_from(
+            Appeal.select(
+                Appeal.id, Appeal.room, Appeal.author, Appeal.created_at,
+                Appeal.message, Value(datetime.now()),
+            ).where(Appeal.id.in_(ids)),
+            [
+                ArchivedAppeal.id, ArchivedAppeal.room, ArchivedAppeal.author,
+                ArchivedAppeal.created_at, ArchivedAppeal.message,
+                ArchivedAppeal.archived_at,
+            ],
+        ).execute()
+        Appeal.delete().where(Appeal.id.in_(ids)).execute()
+    return len(ids)
+
+
+@in_executor
+def incremental_vacuum(pages: int) -> int:
+    """Возвращает системе до pages свободных страниц, возвращает их число
+
+    Только для SQLite с auto_vacuum=incremental, иначе ничего не делает
+    и возвращает 0. В PostgreSQL место освобождает autovacuum.
+    """
+    if not IS_SQLITE:
+        return 0
+    if db.execute_sql("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    before = db.execute_sql("PRAGMA freelist_count").fetchone()[0]
+    db.execute_sql(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+    return before - db.execute_sql("PRAGMA freelist_count").fetchone()[0]
+
+
+# Статистика
+
+class RoomStats(NamedTuple):
+    """Сводка по помещениям администратора из таблиц статистики"""
+    # (название, число обращений) по убыванию
+    last_day: List[Tuple[str, int]]
+    last_month: List[Tuple[str, int]]
+    # (название помещения, ответ, число)
+    answers: List[Tuple[str, str, int]]
+
+
+def _top_rooms(user_id: int, period: str, since: datetime, limit: int):
+    total = fn.SUM(AppealStat.count)
+    return list(
+        AppealStat.select(Room.name, total)
+        .join(Room, on=(AppealStat.room == Room.id))
+        .where(
+            (Room.creator == user_id)
+            & (AppealStat.period == period)
+            & (AppealStat.start >= since)
+        )
+        .group_by(Room.id)
+        .order_by(total.desc())
+        .limit(limit)
+        .tuples()
+    )
+
+
+@in_executor
+def get_room_stats(user_id: int, limit: int = 10) -> RoomStats:
+    """Топ помещений за сутки и 30 дней и топ ответов
+
+    Читает только AppealStat и AnswerStat, поэтому время ответа не
+    зависит от числа обращений.
+    """
+    now = datetime.now()
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    answers = list(
+        AnswerStat.select(Room.name, AnswerStat.text, AnswerStat.count)
+        .join(Room, on=(AnswerStat.room == Room.id))
+        .where(Room.creator == user_id)
+        .order_by(AnswerStat.count.desc())
+        .limit(limit)
+        .tuples()
+    )
+    return RoomStats(
+        last_day=_top_rooms(user_id, "hour", hour - timedelta(hours=23), limit),
+        last_month=_top_rooms(
+            user_id, "day", hour.replace(hour=0) - timedelta(days=29), limit
+        ),
+        answers=answers,
+    )
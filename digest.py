@@ -0,0 +1,123 @@
+"""Сводная рассылка обращений по загруженным помещениям
+
+Вместо сообщения на каждое обращение подписчики получают одно общее
+сообщение раз в несколько минут или по накоплении порога обращений.
+Планировщик работает в цикле событий бота.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from sender import SENDER, Sender
+
+
+logger = logging.getLogger(__name__)
+
+# Ограничение Telegram на длину сообщения
+MESSAGE_LIMIT = 4096
+
+
+class Batch:
+    """Накопленные обращения одного помещения"""
+
+    def __init__(self, room_name: str, deadline: float) -> None:
+        self.room_name = room_name
+        self.deadline = deadline
+        self.chat_ids: List[int] = []
+        self.texts: List[str] = []
+
+
+class Digest:
+    """Буфер сводных рассылок с отправкой по таймеру и по порогу"""
+
+    def __init__(self, sender: Sender, tick: float = 5) -> None:
+        self.sender = sender
+        self.tick = tick
+        self.batches: Dict[int, Batch] = {}
+        self.task: Optional[asyncio.Task] = None
+        # В процессе-обработчике (workers.py) обращения копятся в
+        # главном процессе: forward получает имя метода (add или
+        # flush) и его аргументы
+        self.forward: Optional[Callable[[str, Dict[str, Any]], None]] = None
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self._scheduler())
+
+    async def close(self) -> None:
+        """Останавливает планировщик и отправляет всё накопленное"""
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        for room_id in list(self.batches):
+            self.flush(room_id)
+
+    def add(
+        self,
+        room_id: int,
+        room_name: str,
+        chat_ids: Iterable[int],
+        text: str,
+        interval: int,
+        threshold: int,
+    ) -> None:
+        """Добавляет обращение, interval - в минутах"""
+        if self.forward is not None:
+            self.forward("add", dict(
+                room_id=room_id, room_name=room_name, chat_ids=list(chat_ids),
+                text=text, interval=interval, threshold=threshold,
+            ))
+            return
+        batch = self.batches.get(room_id)
+        if batch is None:
+            batch = Batch(room_name, time.monotonic() + interval * 60)
+            self.batches[room_id] = batch
+        # Получатели на момент последнего обращения
+        batch.chat_ids = list(chat_ids)
+        batch.texts.append(text)
+        if len(batch.texts) >= threshold:
+            self.flush(room_id)
+
+    def flush(self, room_id: int) -> None:
+        """Отправляет накопленные обращения помещения"""
+        if self.forward is not None:
+            self.forward("flush", {"room_id": room_id})
+            return
+        batch = self.batches.pop(room_id, None)
+        if batch is None:
+            return
+        for text in self._format(batch):
+            self.sender.send_many(batch.chat_ids, text)
+
+    @staticmethod
+    def _format(batch: Batch) -> List[str]:
+        """Текст сводки, разбитый на сообщения не длиннее лимита"""
+        header = (
+            f"Обращения по помещению '{batch.room_name}' "
+            f"({len(batch.texts)}):\n\n"
+        )
+        messages, current = [], header
+        for number, text in enumerate(batch.texts, start=1):
+            line = f"{number}. {text}\n"
+            if len(current) + len(line) > MESSAGE_LIMIT:
+                messages.append(current)
+                current = ""
+            current += line[:MESSAGE_LIMIT]
+        messages.append(current)
+        return messages
+
+    async def _scheduler(self) -> None:
+        while True:
+            await asyncio.sleep(self.tick)
+            now = time.monotonic()
+            for room_id, batch in list(self.batches.items()):
+                if batch.deadline <= now:
+                    try:
+                        self.flush(room_id)
+                    except Exception:
+                        logger.exception("Ошибка сводной рассылки %s", room_id)
+
+
+DIGEST = Digest(SENDER)
@@ -0,0 +1,161 @@
+"""Потоковая запись обращений в CSV и XLSX
+
+Писатели получают итератор строк и пишут в двоичный буфер по одной
+строке, поэтому память не зависит от размера выгрузки. XLSX собирается
+вручную через zipfile: лист пишется прямо в сжатый поток архива.
+CSV, не поместившийся в лимит отправки, сжимается compress.
+"""
+
+import csv
+import io
+import os
+import re
+import shutil
+import zipfile
+from typing import IO, Callable, Dict, Iterable, Sequence
+from xml.sax.saxutils import escape
+
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+HEADER = ("id", "Дата", "Помещение", "Автор", "Обращение")
+# Ограничение Excel на число строк листа, с учётом заголовка
+XLSX_SHEET_ROWS = 1_048_575
+
+# Символы, недопустимые в XML 1.0
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+# Предел размера файла, который бот может отправить: 50 МБ у
+# api.telegram.org, 2000 МБ у своего сервера Bot API (BOT_API_URL)
+MAX_UPLOAD_SIZE = int(os.getenv("EXPORT_MAX_SIZE", str(50 * 1024 * 1024)))
+
+
+def write_csv(rows: Iterable[Sequence], out: IO[bytes]) -> int:
+    """Пишет CSV в кодировке UTF-8 с BOM, чтобы Excel открыл кириллицу"""
+    text = io.TextIOWrapper(out, encoding="utf-8-sig", newline="")
+    writer = csv.writer(text)
+    writer.writerow(HEADER)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    text.flush()
+    # Буфер нужен дальше для отправки, не даём обёртке его закрыть
+    text.detach()
+    return count
+
+
+def _cell(value) -> str:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"<c t=\"n\"><v>{value}</v></c>"
+    text = escape(_INVALID_XML.sub("", str(value)))
+    return f"<c t=\"inlineStr\"><is><t xml:space=\"preserve\">{text}</t></is></c>"
+
+
+def _row(values: Sequence) -> bytes:
+    return ("<row>" + "".join(map(_cell, values)) + "</row>").encode("utf-8")
+
+
+_SHEET_START = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    b"<sheetData>"
+)
+_SHEET_END = b"</sheetData></worksheet>"
+
+
+def _workbook_parts(sheets: int) -> Dict[str, str]:
+    """Служебные части книги из sheets листов"""
+    main = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+    rel = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+    package = "http://schemas.openxmlformats.org/package/2006"
+    numbers = range(1, sheets + 1)
+    return {
+        "[Content_Types].xml": (
+            f'<Types xmlns="{package}/content-types">'
+            '<Default Extension="rels" ContentType='
+            '"application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType='
+            '"application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            + "".join(
+                f'<Override PartName="/xl/worksheets/sheet{n}.xml" ContentType='
+                '"application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                for n in numbers
+            )
+            + "</Types>"
+        ),
+        "_rels/.rels": (
+            f'<Relationships xmlns="{package}/relationships">'
+            f'<Relationship Id="rId1" Type="{rel}/officeDocument" '
+            'Target="xl/workbook.xml"/></Relationships>'
+        ),
+        "xl/workbook.xml": (
+            f'<workbook xmlns="{main}" xmlns:r="{rel}"><sheets>'
+            + "".join(
+                f'<sheet name="Обращения {n}" sheetId="{n}" r:id="rId{n}"/>'
+                for n in numbers
+            )
+            + "</sheets></workbook>"
+        ),
+        "xl/_rels/workbook.xml.rels": (
+            f'<Relationships xmlns="{package}/relationships">'
+            + "".join(
+                f'<Relationship Id="rId{n}" Type="{rel}/worksheet" '
+                f'Target="worksheets/sheet{n}.xml"/>'
+                for n in numbers
+            )
+            + "</Relationships>"
+        ),
+    }
+
+
+def write_xlsx(rows: Iterable[Sequence], out: IO[bytes]) -> int:
+    """Пишет книгу XLSX, при переполнении листа начинает следующий"""
+    count = 0
+    sheets = 0
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+        sheet = None
+        for row in rows:
+            if count % XLSX_SHEET_ROWS == 0:
+                if sheet is not None:
+                    sheet.write(_SHEET_END)
+                    sheet.close()
+                sheets += 1
+                sheet = archive.open(
+                    f"xl/worksheets/sheet{sheets}.xml", "w", force_zip64=True
+                )
+                sheet.write(_SHEET_START)
+                sheet.write(_row(HEADER))
+            sheet.write(_row(row))
+            count += 1
+        if sheet is None:
+            sheets = 1
+            archive.writestr(
+                "xl/worksheets/sheet1.xml",
+                _SHEET_START + _row(HEADER) + _SHEET_END,
+            )
+        else:
+            sheet.write(_SHEET_END)
+            sheet.close()
+        for name, content in _workbook_parts(sheets).items():
+            archive.writestr(name, content)
+    return count
+
+
+def compress(source: IO[bytes], out: IO[bytes], filename: str) -> int:
+    """Пишет содержимое source в ZIP-архив out файлом filename,
+    возвращает размер архива"""
+    source.seek(0)
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(filename, "w", force_zip64=True) as target:
+            shutil.copyfileobj(source, target)
+    return out.tell()
+
+
+WRITERS: Dict[str, Callable[[Iterable[Sequence], IO[bytes]], int]] = {
+    "csv": write_csv,
+    "xlsx": write_xlsx,
+}
@@ -4,32 +4,18 @@ from datetime import datetime
 from aiogram.filters import BaseFilter
 from aiogram.types import Message
 
-from models import Role, User, UserRole
+import dao
 
 
 class IsRole(BaseFilter):
-    """Проверяет наличие привелегии у пользователя"""
+    """Проверяет наличие привелегии у пользователя
 
-    def __init__(self, role_name: str) -> None:
-        self.role = Role.get(name=role_name)
-
-    def check(self, user: User) -> bool:
-        """Проверяет у пользователя роль"""
+    Роли загружаются кэшем dao.ROLES при первой проверке, поэтому
+    импорт роутеров не обращается к БД.
+    """
 
-        user_role: UserRole = (
-            UserRole.select()
-            .where(
-                (UserRole.user == user)
-                & (UserRole.role == self.role)
-            )
-            .first()
-        )
-        return user_role is not None
+    def __init__(self, role_name: str) -> None:
+        self.role_name = role_name
 
     async def __call__(self, message: Message) -> bool:
-        user: User = User.get_or_none(id=message.from_user.id)
-
-        if user is None:
-            return False
-
-        return self.check(user)
+        return await dao.has_role(message.from_user.id, self.role_name)
@@ -0,0 +1,214 @@
+"""Хранилище состояний FSM в SQLite
+
+Состояния переживают перезапуск бота. Чтения обслуживаются из кэша в
+памяти, изменения копятся и пишутся в БД пачкой раз в flush_interval
+секунд, состояния без изменений дольше ttl удаляются.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseStorage,
+    DefaultKeyBuilder,
+    StateType,
+    StorageKey,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class Record:
+    """Состояние и данные одного ключа"""
+
+    __slots__ = ("state", "data", "updated_at")
+
+    def __init__(
+        self,
+        state: Optional[str] = None,
+        data: Optional[Dict[str, Any]] = None,
+        updated_at: float = 0,
+    ) -> None:
+        self.state = state
+        self.data = data or {}
+        self.updated_at = updated_at
+
+    def is_empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище с кэшем чтения и отложенной пакетной записью"""
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = 24 * 60 * 60,
+        flush_interval: float = 1.0,
+        cache_size: int = 10_000,
+    ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.cache: "OrderedDict[str, Record]" = OrderedDict()
+        self.dirty: Dict[str, Record] = {}
+        # Один поток - одно соединение sqlite3
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm")
+        self.connection: Optional[sqlite3.Connection] = None
+        self.flush_task: Optional[asyncio.Task] = None
+        self.closed = False
+        self.last_expire = 0.0
+
+    # Работа с БД, выполняется в потоке executor
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path)
+            self.connection.executescript(
+                "PRAGMA journal_mode=wal;"
+                "PRAGMA synchronous=normal;"
+                "CREATE TABLE IF NOT EXISTS fsm ("
+                " key TEXT PRIMARY KEY,"
+                " state TEXT,"
+                " data TEXT NOT NULL,"
+                " updated_at REAL NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS fsm_updated_at ON fsm (updated_at);"
+            )
+        return self.connection
+
+    def _load(self, key: str) -> Record:
+        row = self._connect().execute(
+            "SELECT state, data, updated_at FROM fsm WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return Record()
+        return Record(row[0], json.loads(row[1]), row[2])
+
+    def _write(
+        self,
+        deleted: List[Tuple[str]],
+        rows: List[Tuple[str, Optional[str], str, float]],
+        expire_before: float,
+    ) -> None:
+        connection = self._connect()
+        with connection:
+            connection.executemany("DELETE FROM fsm WHERE key = ?", deleted)
+            connection.executemany(
+                "INSERT OR REPLACE INTO fsm (key, state, data, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            if expire_before:
+                connection.execute(
+                    "DELETE FROM fsm WHERE updated_at < ?", (expire_before,)
+                )
+
+    def _close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    # Кэш
+
+    async def _get(self, key: StorageKey) -> Record:
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_loop())
+
+        str_key = self.key_builder.build(key)
+        record = self.cache.get(str_key)
+        if record is None:
+            record = await self._run(self._load, str_key)
+            # Пока шла загрузка, запись могла появиться в кэше
+            record = self.cache.setdefault(str_key, record)
+        self.cache.move_to_end(str_key)
+
+        if record.updated_at and time.time() - record.updated_at > self.ttl:
+            record.state, record.data = None, {}
+            self.dirty[str_key] = record
+        self._evict()
+        return record
+
+    def _touch(self, key: StorageKey, record: Record) -> None:
+        record.updated_at = time.time()
+        self.dirty[self.key_builder.build(key)] = record
+
+    def _evict(self) -> None:
+        """Выгружает из кэша давно не использованные сохранённые записи"""
+        while len(self.cache) > self.cache_size:
+            key = next(iter(self.cache))
+            if key in self.dirty:
+                break
+            del self.cache[key]
+
+    async def flush(self) -> None:
+        """Записывает накопленные изменения и удаляет устаревшие"""
+        expire_before = 0.0
+        if time.time() - self.last_expire > 60:
+            self.last_expire = time.time()
+            expire_before = self.last_expire - self.ttl
+        if not self.dirty and not expire_before:
+            return
+        records, self.dirty = list(self.dirty.items()), {}
+        # Сериализуем здесь: в потоке записи данные могли бы меняться
+        deleted = [(key,) for key, record in records if record.is_empty()]
+        rows = [
+            (key, record.state, json.dumps(record.data), record.updated_at)
+            for key, record in records if not record.is_empty()
+        ]
+        await self._run(self._write, deleted, rows, expire_before)
+        for key, record in records:
+            if (record.is_empty() and key not in self.dirty
+                    and self.cache.get(key) is record):
+                del self.cache[key]
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Ошибка записи состояний FSM")
+
+    # BaseStorage
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._touch(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        record = await self._get(key)
+        record.data = dict(data)
+        self._touch(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._get(key)).data)
+
+    async def close(self) -> None:
+        # Хранилище закрывает и aiogram при остановке polling, и main
+        if self.closed:
+            return
+        self.closed = True
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        await self.flush()
+        await self._run(self._close)
+        self.executor.shutdown()
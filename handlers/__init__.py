@@ -1,9 +1,17 @@
 from aiogram import Dispatcher
 
+import metrics
+from callbacks import CallbackDataMiddleware
+from middlewares import appeal_throttle
+
 from . import admin, employee, user
 
 
 def add_routers(dp: Dispatcher):
+    if metrics.is_enabled():
+        metrics.setup_dispatcher(dp)
+    dp.message.outer_middleware(appeal_throttle())
+    dp.callback_query.outer_middleware(CallbackDataMiddleware())
     admin.add_routers(dp)
     dp.include_routers(
         employee.ROUTER,
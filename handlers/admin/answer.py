@@ -1,14 +1,16 @@
 from typing import List
 
-from aiogram import F, Router
+from aiogram import Bot, F, Router
 from aiogram.fsm.context import FSMContext
 from aiogram.methods import SendMessage
-from aiogram.types import CallbackQuery, Message
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
 
+import dao
+from callbacks import AnswerDone, AnswerPage, AnswerRemove, AnswerRoom, Is
 from filters import IsRole
 from keyboards import room_answer
-from models import Answer, Room
 from states import AddAnswer
+from wizard import WIZARD, selection_page, toggle
 
 
 router = Router()
@@ -16,49 +18,90 @@ router.message.filter(IsRole("Администратор"))
 router.callback_query.filter(IsRole("Администратор"))
 
 
+def answer_markup(rooms: dao.RoomNames, data: dict) -> InlineKeyboardMarkup:
+    """Клавиатура текущей страницы мастера"""
+    items, prev_page, next_page = selection_page(
+        rooms, data.get('page', 0), data.get('selected', [])
+    )
+    prev_data = next_data = None
+    if prev_page is not None:
+        prev_data = AnswerPage(page=prev_page).pack()
+    if next_page is not None:
+        next_data = AnswerPage(page=next_page).pack()
+    return room_answer(
+        rooms=items, answers=data.get('answers', []),
+        prev_data=prev_data, next_data=next_data,
+    )
+
+
+async def render(
+    bot: Bot, user_id: int, chat_id: int, message_id: int, data: dict
+) -> None:
+    """Обновляет клавиатуру сообщения мастера"""
+    WIZARD.render(
+        bot, chat_id, message_id,
+        answer_markup(await dao.ROOM_NAMES.get(user_id), data),
+    )
+
+
 @router.message(F.text == "Добавить ответы")
 async def add_answer_handler(message: Message, state: FSMContext):
     """Добавление вариантов ответов при ображщении"""
     await state.set_state(state=AddAnswer.waiting_answer)
-    active_rooms: List[Room] = Room.get_active_by_user(
-        user_id=message.from_user.id)
+    rooms = await dao.ROOM_NAMES.get(message.from_user.id)
     data = await state.get_data()
-    data['rooms'] = data.get(
-        'rooms',
-        [(room.id, room.name, False) for room in active_rooms]
-    )
-    data['answers'] = data.get('answers', [])
-    await state.update_data(data=data)
-
+    data = {
+        'selected': data.get('selected', []),
+        'answers': data.get('answers', []),
+        'page': 0,
+    }
+    await state.set_data(data)
+
+    markup = answer_markup(rooms, data)
     m: SendMessage = await message.answer(
         text="Вы перешли в режим добавления отзывов, которые будут "
         "отображаться пользователям при выборе помещения. \n\n"
         "Если передумали, нажмите кнопку Отменить."
         "\nДля завершения, нажмите кнопку Готово",
-        reply_markup=room_answer(rooms=data['rooms'], answers=data['answers']),
+        reply_markup=markup,
     )
+    WIZARD.sent(m.chat.id, m.message_id, markup)
     await state.update_data(last_message=(m.chat.id, m.message_id))
 
 
-@router.callback_query(AddAnswer.waiting_answer,
-                       F.data.startswith("room_answer_"))
-async def mark_room_notify_handler(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(Is(AnswerRoom), AddAnswer.waiting_answer)
+async def mark_room_notify_handler(
+    callback: CallbackQuery, callback_data: AnswerRoom, state: FSMContext
+):
     """Выбрать комнаты для добавления отзывов по ним"""
+    rooms = await dao.ROOM_NAMES.get(callback.from_user.id)
+    if callback_data.room_id not in rooms.names:
+        await callback.answer('Помещение не найдено')
+        return
     data = await state.get_data()
-    rooms = data['rooms']
-    room_id = int(callback.data.split("_")[-1])
-
-    for i, _ in enumerate(rooms):
-        if rooms[i][0] == room_id:
-            rooms[i] = rooms[i][0], rooms[i][1], not rooms[i][2]
-            break
-
-    await callback.message.edit_reply_markup(
-        reply_markup=room_answer(
-            rooms=rooms,
-            answers=data['answers'],
-        )
+    data['selected'] = toggle(data.get('selected', []), callback_data.room_id)
+    await state.update_data(selected=data['selected'])
+
+    WIZARD.render(
+        callback.bot, callback.message.chat.id, callback.message.message_id,
+        answer_markup(rooms, data),
+    )
+    await callback.answer()
+
+
+@router.callback_query(Is(AnswerPage), AddAnswer.waiting_answer)
+async def answer_page_handler(
+    callback: CallbackQuery, callback_data: AnswerPage, state: FSMContext
+):
+    """Страница помещений мастера"""
+    data = await state.get_data()
+    data['page'] = callback_data.page
+    await state.update_data(page=data['page'])
+    await render(
+        callback.bot, callback.from_user.id,
+        callback.message.chat.id, callback.message.message_id, data,
     )
+    await callback.answer()
 
 
 @router.message(AddAnswer.waiting_answer)
@@ -72,20 +115,19 @@ async def get_answer_id_handler(message: Message, state: FSMContext):
         return
     answers.append(answer)
     await state.update_data(answers=answers)
+    data['answers'] = answers
     chat_id, message_id = data['last_message']
-    await message.bot.delete_message(chat_id=chat_id, message_id=message_id)
-    await add_answer_handler(message, state)
+    await render(message.bot, message.from_user.id, chat_id, message_id, data)
 
 
-@router.callback_query(
-    F.data.startswith('del_answer_by_room_notify_'),
-    AddAnswer.waiting_answer,
-)
-async def del_answer_handler(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(Is(AnswerRemove), AddAnswer.waiting_answer)
+async def del_answer_handler(
+    callback: CallbackQuery, callback_data: AnswerRemove, state: FSMContext
+):
     """Удалить отзыва для пользователя"""
     data = await state.get_data()
     answers: List[str] = data.get('answers', [])
-    answer_ind = int(callback.data.split('_')[-1])
+    answer_ind = callback_data.index
 
     if not (0 <= answer_ind < len(answers)):
         await callback.answer(text='Такой отзыв не найден. Обратитесь к администратору')
@@ -93,25 +135,25 @@ async def del_answer_handler(callback: CallbackQuery, state: FSMContext):
 
     del answers[answer_ind]
 
-    await callback.message.edit_reply_markup(
-        reply_markup=room_answer(
-            rooms=data.get('rooms', []),
-            answers=answers,
-        )
+    await render(
+        callback.bot, callback.from_user.id,
+        callback.message.chat.id, callback.message.message_id, data,
     )
     await callback.answer('Отзыв удален')
     await state.update_data(data=data)
 
 
-@router.callback_query(
-    F.data == 'add_answer_done',
-    AddAnswer.waiting_answer)
+@router.callback_query(Is(AnswerDone), AddAnswer.waiting_answer)
 async def next_handlers(cq: CallbackQuery, state: FSMContext):
     """Переход для назначения ответсвенных за аудитории"""
 
     data = await state.get_data()
-    rooms = list(filter(lambda room: room[2], data['rooms']))
-    if len(rooms) == 0:
+    rooms = await dao.ROOM_NAMES.get(cq.from_user.id)
+    room_names = {
+        room_id: rooms.names[room_id]
+        for room_id in data.get('selected', []) if room_id in rooms.names
+    }
+    if len(room_names) == 0:
         await cq.answer('Не выбраны помещения')
         return
 
@@ -119,17 +161,8 @@ async def next_handlers(cq: CallbackQuery, state: FSMContext):
     if len(answers) == 0:
         await cq.answer('Не добавлены отзывы')
 
-    text = []
-
-    for room_id, _, _ in rooms:
-        for answer in answers:
-            notify, created = Answer.get_or_create(
-                text=answer,
-                room_id=room_id
-            )
-
-            if created:
-                text.append(f'{notify.room.name}->{answer}')
+    created = await dao.add_answers(room_ids=room_names, answers=answers)
+    text = [f'{room_names[room_id]}->{answer}' for room_id, answer in created]
 
     if text:
         await cq.message.answer(
@@ -137,6 +170,7 @@ async def next_handlers(cq: CallbackQuery, state: FSMContext):
             ('\n'.join(map(str, text)))
         )
         await state.clear()
+        WIZARD.forget(cq.message.chat.id, cq.message.message_id)
         await cq.message.delete()
     else:
         await cq.answer('Новых отизывов на обращения по можещениям не обнаружено')
@@ -3,10 +3,10 @@ from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
 
+import dao
 from filters import IsRole
 from handlers.common import start_room_handler
 from keyboards import get_admin_menu
-from models import Role, User, UserRole
 
 
 router = Router()
@@ -27,13 +27,13 @@ async def cmd_start(message: Message, state: FSMContext):
 async def add_admin_handler(message: Message):
     try:
         user_id = int(message.text.split()[-1])
-        user = User.get_or_none(id=user_id)
+        user = await dao.get_user(user_id)
 
         if user is None:
             await message.answer(text='Такой полдьзователь не запускал бота')
             return
 
-        UserRole.get_or_create(user=user, role=Role.get(name="Администратор"))
+        await dao.add_role(user.id, "Администратор")
         await message.answer("Роль администратора добавлена")
     except ValueError as ex:
         await message.answer(f"Ошибка: {ex}")
@@ -1,14 +1,16 @@
 ﻿from typing import List
 
-from aiogram import F, Router
+from aiogram import Bot, F, Router
 from aiogram.fsm.context import FSMContext
 from aiogram.methods import SendMessage
-from aiogram.types import CallbackQuery, Message
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
 
+import dao
+from callbacks import Is, NotifyDone, NotifyPage, NotifyRemoveUser, NotifyRoom
 from filters import IsRole
 from keyboards import room_notify
-from models import Notify, Room, User
 from states import AddNotify
+from wizard import WIZARD, selection_page, toggle
 
 
 router = Router()
@@ -16,20 +18,46 @@ router.message.filter(IsRole("Администратор"))
 router.callback_query.filter(IsRole("Администратор"))
 
 
+def notify_markup(rooms: dao.RoomNames, data: dict) -> InlineKeyboardMarkup:
+    """Клавиатура текущей страницы мастера"""
+    items, prev_page, next_page = selection_page(
+        rooms, data.get('page', 0), data.get('selected', [])
+    )
+    prev_data = next_data = None
+    if prev_page is not None:
+        prev_data = NotifyPage(page=prev_page).pack()
+    if next_page is not None:
+        next_data = NotifyPage(page=next_page).pack()
+    return room_notify(
+        rooms=items, users=data.get('users', []),
+        prev_data=prev_data, next_data=next_data,
+    )
+
+
+async def render(
+    bot: Bot, user_id: int, chat_id: int, message_id: int, data: dict
+) -> None:
+    """Обновляет клавиатуру сообщения мастера"""
+    WIZARD.render(
+        bot, chat_id, message_id,
+        notify_markup(await dao.ROOM_NAMES.get(user_id), data),
+    )
+
+
 @router.message(F.text == "Назначить ответственных")
 async def add_user_notify_handler(message: Message, state: FSMContext):
     """Выбрать комнаты для добалвения уведомлений по ним"""
     await state.set_state(state=AddNotify.waiting_room_and_user)
-    active_rooms: List[Room] = Room.get_active_by_user(
-        user_id=message.from_user.id)
+    rooms = await dao.ROOM_NAMES.get(message.from_user.id)
     data = await state.get_data()
-    data['rooms'] = data.get(
-        'rooms',
-        [(room.id, room.name, False) for room in active_rooms]
-    )
-    data['users'] = data.get('users', [])
-    await state.update_data(data=data)
-
+    data = {
+        'selected': data.get('selected', []),
+        'users': data.get('users', []),
+        'page': 0,
+    }
+    await state.set_data(data)
+
+    markup = notify_markup(rooms, data)
     m: SendMessage = await message.answer(
         text="Вы перешли в режим добавления сотрудников, которые будут "
         "получать сообщения о проблемах в определенных помещениях. \n\n"
@@ -37,30 +65,45 @@ async def add_user_notify_handler(message: Message, state: FSMContext):
         "\n\nОтправьте id пользователя. Пользователь его может получить при "
         "помощи команды /get_id \n\nЕсли передумали, нажмите кнопку Отменить."
         "\nДля завершения, нажмите кнопку Готово",
-        reply_markup=room_notify(rooms=data['rooms'], users=data['users']),
+        reply_markup=markup,
     )
+    WIZARD.sent(m.chat.id, m.message_id, markup)
     await state.update_data(last_message=(m.chat.id, m.message_id))
 
 
-@router.callback_query(AddNotify.waiting_room_and_user,
-                       F.data.startswith("room_notify_"))
-async def mark_room_notify_handler(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(Is(NotifyRoom), AddNotify.waiting_room_and_user)
+async def mark_room_notify_handler(
+    callback: CallbackQuery, callback_data: NotifyRoom, state: FSMContext
+):
     """Выбрать комнаты для добавления уведомлений по ним"""
+    rooms = await dao.ROOM_NAMES.get(callback.from_user.id)
+    if callback_data.room_id not in rooms.names:
+        await callback.answer('Помещение не найдено')
+        return
     data = await state.get_data()
-    rooms = data['rooms']
-    room_id = int(callback.data.split("_")[-1])
-
-    for i, _ in enumerate(rooms):
-        if rooms[i][0] == room_id:
-            rooms[i] = rooms[i][0], rooms[i][1], not rooms[i][2]
-            break
-
-    await callback.message.edit_reply_markup(
-        reply_markup=room_notify(
-            rooms=rooms,
-            users=data['users'],
-        )
+    data['selected'] = toggle(data.get('selected', []), callback_data.room_id)
+    await state.update_data(selected=data['selected'])
+
+    WIZARD.render(
+        callback.bot, callback.message.chat.id, callback.message.message_id,
+        notify_markup(rooms, data),
+    )
+    await callback.answer()
+
+
+@router.callback_query(Is(NotifyPage), AddNotify.waiting_room_and_user)
+async def notify_page_handler(
+    callback: CallbackQuery, callback_data: NotifyPage, state: FSMContext
+):
+    """Страница помещений мастера"""
+    data = await state.get_data()
+    data['page'] = callback_data.page
+    await state.update_data(page=data['page'])
+    await render(
+        callback.bot, callback.from_user.id,
+        callback.message.chat.id, callback.message.message_id, data,
     )
+    await callback.answer()
 
 
 @router.message(AddNotify.waiting_room_and_user, F.text.isdigit())
@@ -68,7 +111,7 @@ async def get_user_id_handler(message: Message, state: FSMContext):
     """Добавление пользователей для уведомлений"""
     try:
         user_id = int(message.text)
-        user = User.get_or_none(id=user_id)
+        user = await dao.get_user(user_id)
         if user is None:
             await message.answer(
                 text=f"Пользователя с ID={user_id} нет в БД. "
@@ -82,30 +125,29 @@ async def get_user_id_handler(message: Message, state: FSMContext):
             return
         users.append(user_id)
         await state.update_data(users=users)
+        data['users'] = users
         chat_id, message_id = data['last_message']
-        await message.bot.delete_message(chat_id=chat_id, message_id=message_id)
-        await add_user_notify_handler(message, state)
+        await render(
+            message.bot, message.from_user.id, chat_id, message_id, data
+        )
 
     except ValueError as ex:
         await message.answer(f"Ошибка: {ex}")
 
 
-@router.callback_query(
-    F.data.startswith('del_user_by_room_notify_'),
-    AddNotify.waiting_room_and_user,
-)
-async def del_user_handler(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(Is(NotifyRemoveUser), AddNotify.waiting_room_and_user)
+async def del_user_handler(
+    callback: CallbackQuery, callback_data: NotifyRemoveUser, state: FSMContext
+):
     """Удалить добавляемого пользователя"""
     data = await state.get_data()
     users: List[int] = data.get('users', [])
-    user_id = int(callback.data.split('_')[-1])
+    user_id = callback_data.user_id
     if user_id in users:
         users.remove(user_id)
-        await callback.message.edit_reply_markup(
-            reply_markup=room_notify(
-                rooms=data.get('rooms', []),
-                users=data.get('users', []),
-            )
+        await render(
+            callback.bot, callback.from_user.id,
+            callback.message.chat.id, callback.message.message_id, data,
         )
         await callback.answer('Подписчик удален')
         await state.update_data(data=data)
@@ -113,15 +155,17 @@ async def del_user_handler(callback: CallbackQuery, state: FSMContext):
         await callback.answer('Подписчик не найден')
 
 
-@router.callback_query(
-    F.data == 'add_notify_done',
-    AddNotify.waiting_room_and_user)
+@router.callback_query(Is(NotifyDone), AddNotify.waiting_room_and_user)
 async def next_handlers(cq: CallbackQuery, state: FSMContext):
     """Переход для назначения ответсвенных за аудитории"""
 
     data = await state.get_data()
-    rooms = list(filter(lambda room: room[2], data['rooms']))
-    if len(rooms) == 0:
+    rooms = await dao.ROOM_NAMES.get(cq.from_user.id)
+    room_names = {
+        room_id: rooms.names[room_id]
+        for room_id in data.get('selected', []) if room_id in rooms.names
+    }
+    if len(room_names) == 0:
         await cq.answer('Не выбраны помещения')
         return
 
@@ -129,17 +173,8 @@ async def next_handlers(cq: CallbackQuery, state: FSMContext):
     if len(users) == 0:
         await cq.answer('Не добавлены пользователи')
 
-    text = []
-
-    for room_id, _, _ in rooms:
-        for user_id in users:
-            notify, created = Notify.get_or_create(
-                user_id=user_id,
-                room_id=room_id
-            )
-
-            if created:
-                text.append(f'{notify.room.name}->{notify.user.id}')
+    created = await dao.add_notifies(room_ids=room_names, user_ids=users)
+    text = [f'{room_names[room_id]}->{user_id}' for room_id, user_id in created]
 
     if text:
         await cq.message.answer(
@@ -147,6 +182,7 @@ async def next_handlers(cq: CallbackQuery, state: FSMContext):
             ('\n'.join(map(str, text)))
         )
         await state.clear()
+        WIZARD.forget(cq.message.chat.id, cq.message.message_id)
         await cq.message.delete()
     else:
         await cq.answer('Новых подписчиков на обращения по помещениям не обнаружено')
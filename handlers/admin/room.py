@@ -1,20 +1,46 @@
-﻿import os
-from typing import List
+﻿import asyncio
+from datetime import datetime, timedelta
+from typing import List, Tuple
 
 from aiogram import F, Router
+from aiogram.exceptions import TelegramEntityTooLarge
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.types import (
+    BufferedInputFile,
     CallbackQuery,
-    FSInputFile,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
     Message
 )
 
+import dao
+from callbacks import (
+    AnswerMenu,
+    AppealsPage,
+    Is,
+    RoomAnswers,
+    RoomAppeals,
+    RoomDelete,
+    RoomDeleteCancel,
+    RoomDeleteConfirm,
+    RoomInfo,
+    RoomQR,
+    RoomsPage,
+    SearchPage,
+)
+from digest import DIGEST
+from export import MAX_UPLOAD_SIZE, WRITERS, compress
 from filters import IsRole
-from keyboards import get_delete_confirmation, get_room_actions, get_rooms
+from input_file import SpooledInputFile, spooled_buffer
+from keyboards import (
+    get_delete_confirmation,
+    get_pages,
+    get_room_actions,
+    get_rooms,
+)
 from models import Answer, Appeal, Room
-from qr_code import generate
+from qr_code import QR_CACHE, get_url, render, write_zip
 from states import AdminStates
 
 
@@ -22,6 +48,67 @@ router = Router()
 router.message.filter(IsRole("Администратор"))
 router.callback_query.filter(IsRole("Администратор"))
 
+ROOMS_PAGE_SIZE = 15
+APPEALS_PAGE_SIZE = 10
+CURSOR_TIME_FORMAT = "%Y%m%d%H%M%S%f"
+SEARCH_PAGE_SIZE = 10
+SEARCH_SNIPPET = 300
+
+
+def rooms_markup(page: dao.Page):
+    """Клавиатура страницы помещений, курсоры - id крайних помещений"""
+    rooms: List[Room] = page.items
+    return get_rooms(
+        rooms=[(room.id, room.name) for room in rooms],
+        prev_data=(
+            RoomsPage(direction="p", room_id=rooms[0].id).pack()
+            if page.has_prev else None
+        ),
+        next_data=(
+            RoomsPage(direction="n", room_id=rooms[-1].id).pack()
+            if page.has_next else None
+        ),
+    )
+
+
+def appeals_page_data(direction: str, room_id: int, appeal: Appeal) -> str:
+    return AppealsPage(
+        direction=direction,
+        room_id=room_id,
+        created_at=appeal.created_at.strftime(CURSOR_TIME_FORMAT),
+        appeal_id=appeal.id,
+    ).pack()
+
+
+def parse_appeal_cursor(data: AppealsPage) -> Tuple[datetime, int]:
+    return (
+        datetime.strptime(data.created_at, CURSOR_TIME_FORMAT),
+        data.appeal_id,
+    )
+
+
+def appeals_text(page: dao.Page) -> str:
+    response = "Обращения:\n\n"
+    for appeal in page.items:
+        date_str = appeal.created_at.strftime("%d.%m.%Y %H:%M")
+        response += f"📅 {date_str}\n{appeal.message}\n\n"
+    return response
+
+
+def appeals_markup(room_id: int, page: dao.Page):
+    """Кнопки листания обращений, курсоры - крайние обращения страницы"""
+    appeals: List[Appeal] = page.items
+    return get_pages(
+        prev_data=(
+            appeals_page_data("p", room_id, appeals[0])
+            if page.has_prev else None
+        ),
+        next_data=(
+            appeals_page_data("n", room_id, appeals[-1])
+            if page.has_next else None
+        ),
+    )
+
 
 @router.message(F.text == "Добавить помещение")
 async def add_room_start(message: Message, state: FSMContext):
@@ -35,7 +122,7 @@ async def add_room_finish(message: Message, state: FSMContext):
     room_name = message.text.strip()
 
     # Создаем помещение
-    Room.create(name=room_name, creator=message.from_user.id)
+    await dao.create_room(name=room_name, creator_id=message.from_user.id)
 
     await message.answer(f"Помещение '{room_name}' добавлено!")
     await state.clear()
@@ -43,35 +130,45 @@ async def add_room_finish(message: Message, state: FSMContext):
 
 @router.message(F.text == "Список помещений")
 async def list_rooms(message: Message):
-    rooms: List[Room] = list(
-        Room.select().where(
-            (Room.creator == message.from_user.id) & (Room.is_archived == False)
-        )
+    page = await dao.get_rooms_page(
+        message.from_user.id, limit=ROOMS_PAGE_SIZE
     )
 
-    if len(rooms) == 0:
+    if len(page.items) == 0:
         await message.answer("Нет доступных помещений")
         return
 
-    text = f"Помещения. Всего: {len(rooms)}"
+    await message.answer(text="Помещения", reply_markup=rooms_markup(page))
 
-    await message.answer(
-        text=text,
-        reply_markup=get_rooms(
-            rooms=[(room.id, room.name) for room in rooms],
-        )
+
+@router.callback_query(Is(RoomsPage))
+async def rooms_page_handler(callback: CallbackQuery, callback_data: RoomsPage):
+    """Листание списка помещений"""
+    cursor = callback_data.room_id
+    page = await dao.get_rooms_page(
+        callback.from_user.id,
+        after=cursor if callback_data.direction == "n" else None,
+        before=cursor if callback_data.direction == "p" else None,
+        limit=ROOMS_PAGE_SIZE,
     )
+    if len(page.items) == 0:
+        await callback.answer("Нет доступных помещений")
+        return
+
+    await callback.message.edit_reply_markup(reply_markup=rooms_markup(page))
+    await callback.answer()
 
 
-@router.callback_query(F.data.startswith("room_answers_"))
-async def room_answers_handler(callback: CallbackQuery):
-    room_id = int(callback.data.split("_")[-1])
-    room: Room = Room.get_or_none(id=room_id)
+@router.callback_query(Is(RoomAnswers))
+async def room_answers_handler(
+    callback: CallbackQuery, callback_data: RoomAnswers
+):
+    room: Room = await dao.get_room(callback_data.room_id)
     if room is None:
         await callback.answer("Помещение не найдено")
         return
 
-    answers: List[Answer] = list(Answer.select().where(Answer.room == room.id))
+    answers: List[Answer] = await dao.get_answers(room.id)
 
     inline_keyboard = []
     for answer in answers:
@@ -79,7 +176,7 @@ async def room_answers_handler(callback: CallbackQuery):
             [
                 InlineKeyboardButton(
                     text=str(answer.text),
-                    callback_data=f"answer_menu_{answer.id}",
+                    callback_data=AnswerMenu(answer_id=answer.id).pack(),
                 ),
             ]
         )
@@ -89,10 +186,9 @@ async def room_answers_handler(callback: CallbackQuery):
     await callback.message.answer(text=text, reply_markup=reply_markup)
 
 
-@router.callback_query(F.data.startswith("room_info_"))
-async def show_info_room(callback: CallbackQuery):
-    room_id = int(callback.data.split("_")[-1])
-    room: Room = Room.get_or_none(id=room_id)
+@router.callback_query(Is(RoomInfo))
+async def show_info_room(callback: CallbackQuery, callback_data: RoomInfo):
+    room: Room = await dao.get_room(callback_data.room_id)
     if room is None:
         await callback.answer("Помещение не найдено")
         return
@@ -101,69 +197,322 @@ async def show_info_room(callback: CallbackQuery):
     await callback.answer(text=text)
 
 
-@router.callback_query(F.data.startswith("room_messages_"))
-async def show_appeals(callback: CallbackQuery):
-    room_id = int(callback.data.split("_")[-1])
-
-    room = Room.get_or_none(id=room_id)
+@router.callback_query(Is(RoomAppeals))
+async def show_appeals(callback: CallbackQuery, callback_data: RoomAppeals):
+    room = await dao.get_room(callback_data.room_id)
     if room is None:
         await callback.answer("Помещение не найдено")
         return
 
-    appeals: List[Appeal] = (
-        Appeal.select()
-        .where(Appeal.room == room)
-        .order_by(Appeal.created_at.desc())
-        .limit(10)
-    )
+    page = await dao.get_appeals_page(room.id, limit=APPEALS_PAGE_SIZE)
 
-    if len(appeals) == 0:
+    if len(page.items) == 0:
         await callback.answer("Нет обращений для этого помещения")
         return
 
-    response = "Последние обращения:\n\n"
-    for appeal in appeals:
-        date_str = appeal.created_at.strftime("%d.%m.%Y %H:%M")
-        response += f"📅 {date_str}\n{appeal.message}\n\n"
+    await callback.message.answer(
+        text=appeals_text(page), reply_markup=appeals_markup(room.id, page)
+    )
+    await callback.answer()
+
+
+@router.callback_query(Is(AppealsPage))
+async def appeals_page_handler(
+    callback: CallbackQuery, callback_data: AppealsPage
+):
+    """Листание обращений, сообщение редактируется на месте"""
+    room_id = callback_data.room_id
+    cursor = parse_appeal_cursor(callback_data)
+    page = await dao.get_appeals_page(
+        room_id,
+        after=cursor if callback_data.direction == "n" else None,
+        before=cursor if callback_data.direction == "p" else None,
+        limit=APPEALS_PAGE_SIZE,
+    )
+    if len(page.items) == 0:
+        await callback.answer("Нет обращений для этого помещения")
+        return
 
-    await callback.message.answer(response)
+    await callback.message.edit_text(
+        text=appeals_text(page), reply_markup=appeals_markup(room_id, page)
+    )
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("room_qr_"))
-async def send_qr_code(callback: CallbackQuery):
-    room_id = int(callback.data.split("_")[-1])
+@router.callback_query(Is(RoomQR))
+async def send_qr_code(callback: CallbackQuery, callback_data: RoomQR):
+    room_id = callback_data.room_id
 
-    room = Room.get_or_none(id=room_id)
+    room = await dao.get_room(room_id)
     if room is None:
         await callback.message.answer("Помещение не найдено")
         return
 
-    qr_image, url = generate(
-        room_id=room_id, bot_username=(await callback.bot.me()).username
+    bot_username = (await callback.bot.me()).username
+    url = get_url(room_id, bot_username)
+    caption = f"QR-код для помещения: {room.name}\nURL: {url}"
+
+    # Уже загруженный код отправляем по file_id, без отрисовки и загрузки
+    file_id = QR_CACHE.get(room_id, bot_username)
+    if file_id is not None:
+        await callback.message.answer_photo(file_id, caption=caption)
+        await callback.answer()
+        return
+
+    photo = BufferedInputFile(
+        await render(room_id, bot_username), filename=f"qr_{room_id}.png"
+    )
+    sent = await callback.message.answer_photo(photo, caption=caption)
+    QR_CACHE.set(room_id, bot_username, sent.photo[-1].file_id)
+    await callback.answer()
+
+
+@router.message(Command("digest"))
+async def digest_handler(message: Message):
+    """Сводная рассылка по помещению
+
+    /digest <id помещения> <минуты> [порог] - включить,
+    /digest <id помещения> off - выключить
+    """
+    args = message.text.split()[1:]
+    try:
+        room_id = int(args[0])
+        enable = args[1] != "off"
+        if enable:
+            interval = int(args[1])
+            threshold = int(args[2]) if len(args) > 2 else 20
+            if interval <= 0 or threshold <= 0:
+                raise ValueError("значения должны быть больше нуля")
+    except (IndexError, ValueError) as ex:
+        await message.answer(
+            f"Ошибка: {ex}\n"
+            "/digest <id помещения> <минуты> [порог] - включить сводку\n"
+            "/digest <id помещения> off - выключить"
+        )
+        return
+
+    room = await dao.get_room(room_id)
+    if room is None or room.creator_id != message.from_user.id:
+        await message.answer("Помещение не найдено")
+        return
+
+    if enable:
+        await dao.set_digest(room_id, interval, threshold)
+        await message.answer(
+            f"Обращения по помещению '{room.name}' будут приходить сводкой "
+            f"раз в {interval} мин. или по {threshold} шт."
+        )
+    else:
+        await dao.delete_digest(room_id)
+        DIGEST.flush(room_id)
+        await message.answer(
+            f"Обращения по помещению '{room.name}' снова приходят сразу"
+        )
+
+
+@router.message(Command("qr_all"))
+async def send_all_qr_codes(message: Message):
+    """Архив подписанных QR-кодов всех помещений для печати"""
+    rooms: List[Room] = await dao.get_active_rooms(message.from_user.id)
+    if len(rooms) == 0:
+        await message.answer("Нет доступных помещений")
+        return
+
+    await message.answer(f"Готовим QR-коды для {len(rooms)} помещений...")
+    bot_username = (await message.bot.me()).username
+    archive = spooled_buffer()
+    await asyncio.get_running_loop().run_in_executor(
+        None,
+        write_zip,
+        [(room.id, room.name) for room in rooms],
+        bot_username,
+        archive,
+    )
+    await message.answer_document(
+        SpooledInputFile(archive, filename="qr_codes.zip"),
+        caption=f"QR-коды помещений. Всего: {len(rooms)}",
+    )
+
+
+def parse_export_args(args: List[str]):
+    """[id помещения|all] [с ГГГГ-ММ-ДД] [по ГГГГ-ММ-ДД] [csv|xlsx]"""
+    fmt = "csv"
+    if args and args[-1].lower() in WRITERS:
+        fmt = args.pop().lower()
+    room_id = None
+    if args and args[0] != "all":
+        room_id = int(args[0])
+    args = args[1:]
+    since = datetime.fromisoformat(args[0]) if args else None
+    # Дата «по» включительно
+    until = (
+        datetime.fromisoformat(args[1]) + timedelta(days=1)
+        if len(args) > 1 else None
     )
+    return room_id, since, until, fmt
+
+
+@router.message(Command("export"))
+async def export_handler(message: Message):
+    """Выгрузка обращений файлом
+
+    /export [id помещения|all] [с ГГГГ-ММ-ДД] [по ГГГГ-ММ-ДД] [csv|xlsx]
+    """
+    try:
+        room_id, since, until, fmt = parse_export_args(message.text.split()[1:])
+    except ValueError as ex:
+        await message.answer(
+            f"Ошибка: {ex}\n"
+            "/export [id помещения|all] [с ГГГГ-ММ-ДД] [по ГГГГ-ММ-ДД] "
+            "[csv|xlsx]"
+        )
+        return
+
+    if room_id is not None:
+        room = await dao.get_room(room_id)
+        if room is None or room.creator_id != message.from_user.id:
+            await message.answer("Помещение не найдено")
+            return
 
-    # Создаем временный файл
-    with open(f"qr_{room_id}.png", "wb") as f:
-        f.write(qr_image.getvalue())
+    buffer = spooled_buffer()
+    count = await dao.export_appeals(
+        buffer, WRITERS[fmt], message.from_user.id, room_id, since, until
+    )
+    if count == 0:
+        buffer.close()
+        await message.answer("Обращений за этот период нет")
+        return
 
-    # Отправляем изображение
-    photo = FSInputFile(f"qr_{room_id}.png")
-    await callback.message.answer_photo(
-        photo, caption=f"QR-код для помещения: {room.name}\nURL: {url}"
+    filename = f"appeals_{room_id or 'all'}.{fmt}"
+    size = buffer.tell()
+    if size > MAX_UPLOAD_SIZE and fmt == "csv":
+        # XLSX уже сжат, CSV сжимается в несколько раз
+        archive = spooled_buffer()
+        size = await asyncio.get_running_loop().run_in_executor(
+            None, compress, buffer, archive, filename
+        )
+        buffer.close()
+        buffer, filename = archive, filename + ".zip"
+    too_large = (
+        f"Выгрузка ({count} обращений, {size / 2**20:.1f} МБ) больше "
+        f"предела отправки {MAX_UPLOAD_SIZE / 2**20:.1f} МБ. Укажите "
+        "помещение или период короче"
     )
+    if size > MAX_UPLOAD_SIZE:
+        buffer.close()
+        await message.answer(too_large)
+        return
+
+    try:
+        await message.answer_document(
+            SpooledInputFile(buffer, filename=filename),
+            caption=f"Обращений: {count}",
+        )
+    except TelegramEntityTooLarge:
+        buffer.close()
+        await message.answer(too_large)
 
-    # Удhived = Trueаляем временный файл
-    os.remove(f"qr_{room_id}.png")
+
+def search_text(page: dao.Page, offset: int) -> str:
+    response = "Найденные обращения:\n\n"
+    for number, appeal in enumerate(page.items, start=offset + 1):
+        date_str = appeal.created_at.strftime("%d.%m.%Y %H:%M")
+        message = appeal.message
+        if len(message) > SEARCH_SNIPPET:
+            message = message[:SEARCH_SNIPPET] + "…"
+        response += f"{number}. 📅 {date_str}, {appeal.name}\n{message}\n\n"
+    return response
+
+
+def search_markup(page: dao.Page, offset: int):
+    """Кнопки листания результатов, в данных - смещение страницы"""
+    return get_pages(
+        prev_data=(
+            SearchPage(offset=max(offset - SEARCH_PAGE_SIZE, 0)).pack()
+            if page.has_prev else None
+        ),
+        next_data=(
+            SearchPage(offset=offset + SEARCH_PAGE_SIZE).pack()
+            if page.has_next else None
+        ),
+    )
+
+
+@router.message(Command("search"))
+async def search_handler(message: Message, command: CommandObject,
+                         state: FSMContext):
+    """Полнотекстовый поиск по обращениям своих помещений
+
+    /search <слова>
+    """
+    text = (command.args or "").strip()
+    if not text:
+        await message.answer("Использование: /search <слова>")
+        return
+
+    page = await dao.search_appeals(
+        message.from_user.id, text, limit=SEARCH_PAGE_SIZE
+    )
+    if len(page.items) == 0:
+        await message.answer("Ничего не найдено")
+        return
+
+    # Текст запроса не помещается в callback_data, храним его в FSM
+    await state.update_data(search_query=text)
+    await message.answer(
+        text=search_text(page, 0), reply_markup=search_markup(page, 0)
+    )
+
+
+@router.callback_query(Is(SearchPage))
+async def search_page_handler(
+    callback: CallbackQuery, callback_data: SearchPage, state: FSMContext
+):
+    text = (await state.get_data()).get("search_query")
+    if text is None:
+        await callback.answer("Поиск устарел, повторите /search")
+        return
+
+    offset = callback_data.offset
+    page = await dao.search_appeals(
+        callback.from_user.id, text, offset=offset, limit=SEARCH_PAGE_SIZE
+    )
+    if len(page.items) == 0:
+        await callback.answer("Ничего не найдено")
+        return
+
+    await callback.message.edit_text(
+        text=search_text(page, offset),
+        reply_markup=search_markup(page, offset),
+    )
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("room_delete_"))
-async def delete_room_start(callback: CallbackQuery):
+@router.message(Command("stats"))
+async def stats_handler(message: Message):
+    """Статистика обращений по помещениям администратора"""
+    stats: dao.RoomStats = await dao.get_room_stats(message.from_user.id)
+    if not (stats.last_day or stats.last_month or stats.answers):
+        await message.answer("Обращений пока нет")
+        return
+
+    lines = ["Обращения за сутки:"]
+    lines += [f"{count} - {name}" for name, count in stats.last_day] or ["нет"]
+    lines += ["", "Обращения за 30 дней:"]
+    lines += [f"{count} - {name}" for name, count in stats.last_month] or ["нет"]
+    lines += ["", "Частые ответы:"]
+    lines += [
+        f"{count} - {text} ({name})" for name, text, count in stats.answers
+    ] or ["нет"]
+    await message.answer("\n".join(lines))
+
+
+@router.callback_query(Is(RoomDelete))
+async def delete_room_start(callback: CallbackQuery, callback_data: RoomDelete):
     """Удалить помещение"""
-    room_id = int(callback.data.split("_")[-1])
+    room_id = callback_data.room_id
 
-    room = Room.get_or_none(id=room_id)
+    room = await dao.get_room(room_id)
     if room is None:
         await callback.message.answer("Помещение не найдено")
         return
@@ -174,24 +523,25 @@ async def delete_room_start(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("cancel_delete_"))
-async def cancel_delete(callback: CallbackQuery):
-    room_id = int(callback.data.split("_")[-1])
-    keyboard = get_room_actions(room_id)
+@router.callback_query(Is(RoomDeleteCancel))
+async def cancel_delete(
+    callback: CallbackQuery, callback_data: RoomDeleteCancel
+):
+    keyboard = get_room_actions(callback_data.room_id)
     await callback.message.edit_reply_markup(reply_markup=keyboard)
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("confirm_delete_"))
-async def confirm_delete(callback: CallbackQuery):
-    room_id = int(callback.data.split("_")[-1])
-    room = Room.get_or_none(id=room_id)
+@router.callback_query(Is(RoomDeleteConfirm))
+async def confirm_delete(
+    callback: CallbackQuery, callback_data: RoomDeleteConfirm
+):
+    room = await dao.get_room(callback_data.room_id)
     if room is None:
         await callback.message.answer("Помещение не найдено")
         return
 
-    room.is_archived = True
-    room.save()
+    await dao.archive_room(room.id)
 
     await callback.message.edit_text(
         text=f"Помещение '{room.name}' удалено", reply_markup=None
@@ -1,21 +1,22 @@
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 
-from keyboards import get_menu_by_room
-from models import Room, User
+import dao
 from states import UserStates
 
 
 async def start_room_handler(message: Message, state: FSMContext):
     await state.clear()
-    User.get_or_none(id=message.from_user.id)
+    # Без строки User администратор не сможет добавить пользователя
+    # в подписчики или сотрудники
+    await dao.add_user(message.from_user.id)
     # Проверяем параметры команды
     if len(message.text.split()) > 1:
         # Пользователь перешел по QR-коду
         param = message.text.split()[1]
         if param.startswith('room_'):
             room_id = int(param.split('_')[1])
-            room: Room = Room.get_or_none(id=room_id)
+            room: dao.RoomSnapshot = await dao.ROOMS.get(room_id)
             if room is None:
                 await message.answer("Помещение не найдено")
                 return False
@@ -24,7 +25,7 @@ async def start_room_handler(message: Message, state: FSMContext):
             await state.set_state(state=UserStates.waiting_for_appeal)
             await message.answer(
                 text=f"Выберите вариант обращения из меню или напишите своё по помещению '{room.name}'",
-                reply_markup=get_menu_by_room(answers=[a.text for a in room.answers])
+                reply_markup=room.menu
             )
             return False
 
@@ -4,8 +4,11 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.enums import ParseMode
 
-from models import Appeal, Notify, Room
+import dao
+from digest import DIGEST
+from sender import SENDER
 from states import UserStates
+from wizard import WIZARD
 from handlers.common import start_room_handler
 
 ROUTER = Router()
@@ -28,25 +31,41 @@ async def handle_appeal(message: Message, state: FSMContext):
         await state.clear()
         return
 
-    room = Room.get_or_none(id=room_id)
+    room: dao.RoomSnapshot = await dao.ROOMS.get(room_id)
     if room is None:
         await message.answer("Помещение не найдено")
+        await state.clear()
+        return
 
     # Сохраняем обращение
-    Appeal.create(room=room, author=message.from_user.id, message=message.text)
+    await dao.create_appeal(
+        room_id=room.id,
+        author_id=message.from_user.id,
+        message=message.text,
+        is_answer=message.text in room.answers,
+    )
 
     # Отправляем подтверждение пользователю
     await message.answer("Спасибо за обращение, мы уже его передали администрации")
 
-    # Пересылаем обращение администратору
-    # admin_user = User.gegek htrdtcnj dytnbt(User.user_id == room.admin_id)
-    appeal_text = f"Новое обращение по помещению '{
-        room.name}':\n\n{
-        message.text}"
-    await message.bot.send_message(room.creator.id, appeal_text)
-    nitifys: list[Notify] = list(Notify.select().where(Notify.room == room.id))
-    for notify in nitifys:
-        await message.bot.send_message(notify.user.id, appeal_text)
+    # Ставим в очередь рассылку администратору и подписчикам,
+    # отправкой занимается SENDER в фоне
+    chat_ids = (room.creator_id,) + room.subscriber_ids
+    if room.digest is None:
+        appeal_text = (
+            f"Новое обращение по помещению '{room.name}':\n\n{message.text}"
+        )
+        SENDER.send_many(chat_ids, appeal_text)
+    else:
+        interval, threshold = room.digest
+        DIGEST.add(
+            room_id=room.id,
+            room_name=room.name,
+            chat_ids=chat_ids,
+            text=message.text,
+            interval=interval,
+            threshold=threshold,
+        )
     await state.clear()
 
 
@@ -61,4 +80,5 @@ async def get_id_handler(message: Message):
 async def cancel_handler(cq: CallbackQuery, state: FSMContext):
     """Сброс состояний"""
     await state.clear()
+    WIZARD.forget(cq.message.chat.id, cq.message.message_id)
     await cq.message.delete()
@@ -0,0 +1,39 @@
+"""Отправка больших файлов без загрузки их целиком в память"""
+
+import asyncio
+import tempfile
+from typing import IO, AsyncGenerator
+
+from aiogram import Bot
+from aiogram.types import InputFile
+
+
+# Сколько держать в памяти до сброса временного файла на диск
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+def spooled_buffer() -> IO[bytes]:
+    """Временный буфер: в памяти, пока небольшой, дальше на диске"""
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+
+
+class SpooledInputFile(InputFile):
+    """Файл для отправки из открытого буфера, читается частями
+
+    Буфер закрывается после отправки.
+    """
+
+    def __init__(self, file: IO[bytes], filename: str, **kwargs) -> None:
+        super().__init__(filename=filename, **kwargs)
+        self.file = file
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        loop = asyncio.get_running_loop()
+        self.file.seek(0)
+        try:
+            while chunk := await loop.run_in_executor(
+                None, self.file.read, self.chunk_size
+            ):
+                yield chunk
+        finally:
+            self.file.close()
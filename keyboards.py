@@ -1,6 +1,22 @@
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
 
+from callbacks import (
+    AnswerDone,
+    AnswerRemove,
+    AnswerRoom,
+    NotifyDone,
+    NotifyRemoveUser,
+    NotifyRoom,
+    RoomAnswers,
+    RoomAppeals,
+    RoomDelete,
+    RoomDeleteCancel,
+    RoomDeleteConfirm,
+    RoomInfo,
+    RoomQR,
+)
+
 
 def get_admin_menu() -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(
@@ -28,9 +44,9 @@ def get_menu_by_room(answers: List[str]):
 def get_room_actions(room_id) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="Обращения", callback_data=f"appeals_{room_id}")],
-            [InlineKeyboardButton(text="QR-code", callback_data=f"qrcode_{room_id}")],
-            [InlineKeyboardButton(text="Удалить", callback_data=f"delete_{room_id}")]
+            [InlineKeyboardButton(text="Обращения", callback_data=RoomAppeals(room_id=room_id).pack())],
+            [InlineKeyboardButton(text="QR-code", callback_data=RoomQR(room_id=room_id).pack())],
+            [InlineKeyboardButton(text="Удалить", callback_data=RoomDelete(room_id=room_id).pack())]
         ]
     )
 
@@ -40,15 +56,21 @@ def get_delete_confirmation(room_id: int) -> InlineKeyboardMarkup:
         inline_keyboard=[
             [InlineKeyboardButton(
                 text="Подтвердить",
-                callback_data=f"confirm_delete_{room_id}")],
+                callback_data=RoomDeleteConfirm(room_id=room_id).pack())],
             [InlineKeyboardButton(
                 text="Отмена",
-                callback_data=f"cancel_delete_{room_id}")]
+                callback_data=RoomDeleteCancel(room_id=room_id).pack())]
         ]
     )
 
 
-def room_answer(rooms: List[Tuple[int, str, bool]], answers: List[str]):
+def room_answer(
+    rooms: List[Tuple[int, str, bool]],
+    answers: List[str],
+    prev_data: Optional[str] = None,
+    next_data: Optional[str] = None,
+):
+    """rooms - страница помещений мастера: (id, название, выбрано)"""
     inline_keyboard = []
     row = []
     for room_id, room_name, mark in rooms:
@@ -58,10 +80,13 @@ def room_answer(rooms: List[Tuple[int, str, bool]], answers: List[str]):
         row.append(
             InlineKeyboardButton(
                 text=f"{'✅' if mark else '❌'} {room_name}",
-                callback_data=f"room_answer_{room_id}"
+                callback_data=AnswerRoom(room_id=room_id).pack()
             )
         )
 
+    if row:
+        inline_keyboard.append(row)
+    row = pagination_row(prev_data, next_data)
     if row:
         inline_keyboard.append(row)
 
@@ -69,14 +94,14 @@ def room_answer(rooms: List[Tuple[int, str, bool]], answers: List[str]):
         inline_keyboard.append([
             InlineKeyboardButton(
                 text=f"🗑️ {answer}",
-                callback_data=f"del_answer_by_room_notify_{ind}"
+                callback_data=AnswerRemove(index=ind).pack()
             )
         ])
 
     inline_keyboard.append([
         InlineKeyboardButton(
             text='Готово',
-            callback_data='add_answer_done'
+            callback_data=AnswerDone().pack()
         ),
         InlineKeyboardButton(
             text='Отменить',
@@ -88,7 +113,13 @@ def room_answer(rooms: List[Tuple[int, str, bool]], answers: List[str]):
     )
 
 
-def room_notify(rooms: List[Tuple[int, str, bool]], users: List[int]):
+def room_notify(
+    rooms: List[Tuple[int, str, bool]],
+    users: List[int],
+    prev_data: Optional[str] = None,
+    next_data: Optional[str] = None,
+):
+    """rooms - страница помещений мастера: (id, название, выбрано)"""
     inline_keyboard = []
     row = []
     for room_id, room_name, mark in rooms:
@@ -98,10 +129,13 @@ def room_notify(rooms: List[Tuple[int, str, bool]], users: List[int]):
         row.append(
             InlineKeyboardButton(
                 text=f"{'✅' if mark else '❌'} {room_name}",
-                callback_data=f"room_notify_{room_id}"
+                callback_data=NotifyRoom(room_id=room_id).pack()
             )
         )
 
+    if row:
+        inline_keyboard.append(row)
+    row = pagination_row(prev_data, next_data)
     if row:
         inline_keyboard.append(row)
 
@@ -109,14 +143,14 @@ def room_notify(rooms: List[Tuple[int, str, bool]], users: List[int]):
         inline_keyboard.append([
             InlineKeyboardButton(
                 text=f"🗑️ {user_id}",
-                callback_data=f"del_user_by_room_notify_{user_id}"
+                callback_data=NotifyRemoveUser(user_id=user_id).pack()
             )
         ])
 
     inline_keyboard.append([
         InlineKeyboardButton(
             text='Готово',
-            callback_data='add_notify_done'
+            callback_data=NotifyDone().pack()
         ),
         InlineKeyboardButton(
             text='Отменить',
@@ -128,26 +162,57 @@ def room_notify(rooms: List[Tuple[int, str, bool]], users: List[int]):
     )
 
 
-def get_rooms(rooms: List[Tuple[int, str]]):
+def pagination_row(
+    prev_data: Optional[str], next_data: Optional[str]
+) -> List[InlineKeyboardButton]:
+    row = []
+    if prev_data:
+        row.append(InlineKeyboardButton(text="⬅️", callback_data=prev_data))
+    if next_data:
+        row.append(InlineKeyboardButton(text="➡️", callback_data=next_data))
+    return row
+
+
+def get_pages(
+    prev_data: Optional[str], next_data: Optional[str]
+) -> Optional[InlineKeyboardMarkup]:
+    row = pagination_row(prev_data, next_data)
+    if not row:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[row])
+
+
+def get_rooms(
+    rooms: List[Tuple[int, str]],
+    prev_data: Optional[str] = None,
+    next_data: Optional[str] = None,
+):
     inline_keyboard = []
     for room_id, room_name in rooms:
         inline_keyboard.append(
             [
                 InlineKeyboardButton(
-                    text=room_name, callback_data=f"room_info_{room_id}"
+                    text=room_name,
+                    callback_data=RoomInfo(room_id=room_id).pack(),
                 ),
                 InlineKeyboardButton(
-                    text="📃", callback_data=f"room_messages_{room_id}"
+                    text="📃",
+                    callback_data=RoomAppeals(room_id=room_id).pack(),
                 ),
                 InlineKeyboardButton(
-                    text="❓", callback_data=f"room_answers_{room_id}"
+                    text="❓",
+                    callback_data=RoomAnswers(room_id=room_id).pack(),
                 ),
                 InlineKeyboardButton(
-                    text="QR", callback_data=f"room_qr_{room_id}"
+                    text="QR", callback_data=RoomQR(room_id=room_id).pack()
                 ),
                 InlineKeyboardButton(
-                    text="🗑️", callback_data=f"room_delete_{room_id}"
+                    text="🗑️",
+                    callback_data=RoomDelete(room_id=room_id).pack(),
                 ),
             ]
         )
+    row = pagination_row(prev_data, next_data)
+    if row:
+        inline_keyboard.append(row)
     return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
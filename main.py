@@ -1,21 +1,97 @@
 import os
+from typing import Awaitable, Callable
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+import metrics
+from digest import DIGEST
+from fsm_storage import SQLiteStorage
 from handlers import add_routers
+import qr_code
 from models import create_tables
+from retention import retention
+from sender import SENDER
+from webhook import run_webhook
+from wizard import WIZARD
+from workers import run_intake
 
 
 load_dotenv()
 
-# Настройка бота
-BOT = Bot(token=os.getenv("BOT_TOKEN"))
+
+def create_bot() -> Bot:
+    """Бот, BOT_API_URL - адрес своего сервера Bot API"""
+    session = None
+    if os.getenv("BOT_API_URL"):
+        session = AiohttpSession(
+            api=TelegramAPIServer.from_base(os.getenv("BOT_API_URL"))
+        )
+    return Bot(token=os.getenv("BOT_TOKEN"), session=session)
+
+
+def create_storage() -> BaseStorage:
+    """Хранилище FSM: FSM_STORAGE=sqlite (по умолчанию) или memory"""
+    if os.getenv("FSM_STORAGE", "sqlite") == "memory":
+        return MemoryStorage()
+    return SQLiteStorage(
+        path=os.getenv(
+            "FSM_DB_PATH",
+            os.path.join(os.path.dirname(__file__), "data", "fsm.db"),
+        ),
+        ttl=float(os.getenv("FSM_TTL", str(24 * 60 * 60))),
+    )
+
+
+async def receive_updates(dp: Dispatcher, bot: Bot) -> None:
+    # BOT_MODE=webhook - принимать обновления через вебхук
+    if os.getenv("BOT_MODE", "polling") == "webhook":
+        await run_webhook(dp, bot)
+    else:
+        await dp.start_polling(bot)
+
+
+async def run_dispatcher(
+    bot: Bot, receive: Callable[[Dispatcher, Bot], Awaitable[None]]
+) -> None:
+    """Диспетчер с обработчиками, обновления доставляет receive"""
+    dp = Dispatcher(storage=create_storage())
+    add_routers(dp=dp)
+    metrics_server = None
+    if metrics.is_enabled():
+        metrics.setup_bot(bot)
+        metrics_server = await metrics.start_server()
+    SENDER.start(bot)
+    DIGEST.start()
+    try:
+        await receive(dp, bot)
+    finally:
+        await WIZARD.close()
+        await DIGEST.close()
+        await SENDER.close()
+        await dp.storage.close()
+        await bot.session.close()
+        qr_code.shutdown()
+        if metrics_server is not None:
+            await metrics_server.cleanup()
 
 
 async def main():
     create_tables()
-    dp = Dispatcher()
-    add_routers(dp=dp)
-    await dp.start_polling(BOT)
+    bot = create_bot()
+    appeal_retention = retention()
+    appeal_retention.start()
+    try:
+        # BOT_WORKERS=N - обрабатывать обновления в N процессах
+        workers = int(os.getenv("BOT_WORKERS", "0"))
+        if workers > 0:
+            await run_intake(bot, workers, receive_updates)
+        else:
+            await run_dispatcher(bot, receive_updates)
+    finally:
+        await appeal_retention.close()
 
 
 if __name__ == "__main__":
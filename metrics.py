@@ -0,0 +1,267 @@
+"""Метрики бота в формате Prometheus
+
+Включаются переменной METRICS_PORT: тогда add_routers подключает
+middleware, а main поднимает HTTP-сервер с /metrics на METRICS_HOST
+(127.0.0.1 по умолчанию). Без METRICS_PORT ничего не подключается.
+"""
+
+import bisect
+import contextvars
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+from aiohttp import web
+from dotenv import load_dotenv
+
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _labels(names: Sequence[str], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{str(value).replace(chr(34), chr(39))}"'
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels: str, value: float = 1) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return "\n".join(lines)
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [счётчики корзин..., сумма, количество]
+        self.values: Dict[Tuple[str, ...], list] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self.lock:
+            row = self.values.get(labels)
+            if row is None:
+                row = self.values[labels] = [0] * (len(self.buckets) + 2)
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                row[index] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} histogram",
+        ]
+        names = self.label_names + ("le",)
+        for labels, row in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_labels(names, labels + (bound,))} "
+                    f"{cumulative}"
+                )
+            lines.append(
+                f"{self.name}_bucket{_labels(names, labels + ('+Inf',))} "
+                f"{row[-1]}"
+            )
+            suffix = _labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{suffix} {row[-2]}")
+            lines.append(f"{self.name}_count{suffix} {row[-1]}")
+        return "\n".join(lines)
+
+
+UPDATE_SECONDS = Histogram(
+    "bot_update_seconds", "Время обработки обновления", ["handler"]
+)
+HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds", "Время работы обработчика", ["handler"]
+)
+UPDATE_SQL = Histogram(
+    "bot_update_sql_queries", "SQL-запросов на обновление", ["handler"],
+    buckets=COUNT_BUCKETS,
+)
+SQL_QUERIES = Counter("bot_sql_queries_total", "Выполнено SQL-запросов")
+API_SECONDS = Histogram(
+    "bot_api_request_seconds", "Время запросов к Bot API", ["method"]
+)
+API_ERRORS = Counter(
+    "bot_api_errors_total", "Ошибки запросов к Bot API", ["method", "error"]
+)
+# Число обновлений, пришедших в каждом состоянии, а не число
+# пользователей в состоянии сейчас
+STATE_UPDATES = Counter(
+    "bot_fsm_state_updates_total",
+    "Обновления по состоянию FSM на момент прихода", ["state"],
+)
+METRICS = (
+    UPDATE_SECONDS, HANDLER_SECONDS, UPDATE_SQL, SQL_QUERIES, API_SECONDS,
+    API_ERRORS, STATE_UPDATES,
+)
+
+
+class UpdateStats:
+    """Данные одного обновления, доступные через contextvar"""
+
+    __slots__ = ("handler", "sql")
+
+    def __init__(self) -> None:
+        self.handler = "unhandled"
+        self.sql = 0
+
+
+CURRENT: contextvars.ContextVar[Optional[UpdateStats]] = contextvars.ContextVar(
+    "update_stats", default=None
+)
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware: время и число SQL-запросов на обновление"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        stats = UpdateStats()
+        token = CURRENT.set(stats)
+        STATE_UPDATES.inc(data.get("raw_state") or "none")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            UPDATE_SECONDS.observe(time.perf_counter() - started, stats.handler)
+            UPDATE_SQL.observe(stats.sql, stats.handler)
+            CURRENT.reset(token)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware: имя и время работы обработчика"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        callback = data["handler"].callback
+        name = f"{callback.__module__}.{callback.__name__}"
+        stats = CURRENT.get()
+        if stats is not None:
+            stats.handler = name
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+
+
+class RequestMetricsMiddleware(BaseRequestMiddleware):
+    """Время и ошибки запросов к Bot API"""
+
+    async def __call__(self, make_request, bot: Bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as ex:
+            API_ERRORS.inc(name, type(ex).__name__)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - started, name)
+
+
+def count_sql(database) -> None:
+    """Считает запросы peewee, в том числе по текущему обновлению
+
+    Запросы из пула dao видят contextvar обновления, так как dao.run
+    выполняет их в копии контекста. Повторный вызов для той же базы
+    ничего не меняет.
+    """
+    if getattr(database, "_counted_sql", False):
+        return
+    execute_sql = database.execute_sql
+
+    def wrapper(sql, params=None, **kwargs):
+        SQL_QUERIES.inc()
+        stats = CURRENT.get()
+        if stats is not None:
+            stats.sql += 1
+        return execute_sql(sql, params, **kwargs)
+
+    database.execute_sql = wrapper
+    database._counted_sql = True
+
+
+def is_enabled() -> bool:
+    load_dotenv()
+    return bool(os.getenv("METRICS_PORT"))
+
+
+def setup_dispatcher(dp: Dispatcher) -> None:
+    from models import db
+
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    for observer in (dp.message, dp.callback_query):
+        observer.middleware(HandlerMetricsMiddleware())
+    count_sql(db)
+
+
+def setup_bot(bot: Bot) -> None:
+    bot.session.middleware(RequestMetricsMiddleware())
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in METRICS) + "\n"
+
+
+async def start_server() -> web.AppRunner:
+    """HTTP-сервер с /metrics, останавливается через runner.cleanup()"""
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=render(), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(
+        runner,
+        host=os.getenv("METRICS_HOST", "127.0.0.1"),
+        port=int(os.getenv("METRICS_PORT")),
+    ).start()
+    return runner
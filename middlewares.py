@@ -0,0 +1,112 @@
+"""Промежуточные обработчики диспетчера"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+from dotenv import load_dotenv
+
+from sender import TokenBucket
+from states import UserStates
+
+
+class LRU(OrderedDict):
+    """Словарь ограниченного размера, вытесняет давно не использованное"""
+
+    def __init__(self, max_size: int) -> None:
+        super().__init__()
+        self.max_size = max_size
+
+    def touch(self, key: Hashable) -> None:
+        self.move_to_end(key)
+        while len(self) > self.max_size:
+            self.popitem(last=False)
+
+
+class AppealThrottleMiddleware(BaseMiddleware):
+    """Ограничивает поток обращений от пользователя и по помещению
+
+    Лимиты - ведра токенов на пользователя и на помещение, плюс
+    подавление повторов одного текста в одно помещение за window секунд.
+    Отклонённое обращение не доходит до БД и рассылки.
+    """
+
+    def __init__(
+        self,
+        user_per_minute: float = 5,
+        user_burst: float = 3,
+        room_per_minute: float = 60,
+        room_burst: float = 20,
+        duplicate_window: float = 600,
+        max_size: int = 10_000,
+    ) -> None:
+        self.user_rate = user_per_minute / 60
+        self.user_burst = user_burst
+        self.room_rate = room_per_minute / 60
+        self.room_burst = room_burst
+        self.duplicate_window = duplicate_window
+        self.user_buckets = LRU(max_size)
+        self.room_buckets = LRU(max_size)
+        self.recent = LRU(max_size)
+
+    @staticmethod
+    def _bucket(buckets: LRU, key: int, rate: float, burst: float) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate, burst)
+        buckets.touch(key)
+        return bucket
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        if data.get("raw_state") != UserStates.waiting_for_appeal.state:
+            return await handler(event, data)
+
+        # Команды (например, повторный /start) обращениями не считаем
+        if event.text is None or event.text.startswith("/"):
+            return await handler(event, data)
+        room_id = (await data["state"].get_data()).get("room_id")
+        if room_id is None:
+            return await handler(event, data)
+
+        user_id = event.from_user.id
+        key = (user_id, room_id, event.text.strip().lower())
+        now = time.monotonic()
+        sent_at = self.recent.get(key)
+        if sent_at is not None and now - sent_at < self.duplicate_window:
+            await event.answer("Такое обращение уже отправлено, спасибо")
+            return None
+
+        user = self._bucket(
+            self.user_buckets, user_id, self.user_rate, self.user_burst
+        )
+        room = self._bucket(
+            self.room_buckets, room_id, self.room_rate, self.room_burst
+        )
+        # Токен списывается, только если обращение пропускают оба ведра
+        if user.wait_time() > 0 or room.wait_time() > 0:
+            await event.answer("Слишком много обращений, попробуйте позже")
+            return None
+        user.take()
+        room.take()
+
+        self.recent[key] = now
+        self.recent.touch(key)
+        return await handler(event, data)
+
+
+def appeal_throttle() -> AppealThrottleMiddleware:
+    """Middleware с настройками из окружения"""
+    load_dotenv()
+    return AppealThrottleMiddleware(
+        user_per_minute=float(os.getenv("THROTTLE_USER_PER_MINUTE", "5")),
+        room_per_minute=float(os.getenv("THROTTLE_ROOM_PER_MINUTE", "60")),
+        duplicate_window=float(os.getenv("THROTTLE_DUPLICATE_WINDOW", "600")),
+    )
@@ -0,0 +1,288 @@
+"""Миграции схемы БД
+
+Миграция - функция в MIGRATIONS, её номер - позиция в списке,
+начиная с 1. Применённые номера записываются в таблицу schemaversion.
+migrate() применяет только недостающие миграции по порядку, каждую
+в своей транзакции. Когда схема актуальна, это два запроса.
+
+Миграция не использует модели из models.py: они описывают текущую
+схему, и после их изменения свежая база уже в первой миграции
+получила бы новую схему, а следующая миграция, меняющая её, упала бы.
+Поэтому каждая миграция объявляет свои замороженные копии моделей
+(классы внутри функции, имена классов совпадают с таблицами) или
+выполняет SQL. Миграцию, попавшую в список, больше не меняют, новые
+добавляются только в конец.
+
+Миграции базы, созданной до появления schemaversion, применяются
+заново, поэтому они не должны ломать уже существующие таблицы.
+
+    python migrations.py
+"""
+
+import logging
+from typing import Callable, List
+
+from peewee import (
+    BigAutoField, BooleanField, CharField, DateTimeField, ForeignKeyField,
+    IntegerField, Model, TextField, fn
+)
+
+from models import IS_SQLITE, SchemaVersion, db, write_transaction
+
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS: List[Callable[[], None]] = []
+
+
+def migration(func: Callable[[], None]) -> Callable[[], None]:
+    MIGRATIONS.append(func)
+    return func
+
+
+class Frozen(Model):
+    """Основа замороженных моделей миграций"""
+
+    class Meta:
+        database = db
+
+
+class User(Frozen):
+    """Ссылки внешних ключей на user и room в миграциях"""
+    id = BigAutoField()
+
+
+class Room(Frozen):
+    pass
+
+
+def drop_duplicates(model, *fields):
+    """Удаляет дубли перед созданием уникального индекса"""
+    if not model.table_exists():
+        return
+    keep = model.select(fn.MIN(model.id)).group_by(*fields)
+    model.delete().where(model.id.not_in(keep)).execute()
+
+
+@migration
+def initial() -> None:
+    """Помещения, обращения, роли, подписчики и ответы"""
+
+    class Role(Frozen):
+        name = CharField()
+
+    class UserRole(Frozen):
+        user = ForeignKeyField(User, index=False)
+        role = ForeignKeyField(Role)
+
+        class Meta:
+            indexes = ((("user", "role"), True),)
+
+    class Room(Frozen):
+        name = CharField()
+        creator = ForeignKeyField(User, index=False)
+        is_archived = BooleanField(default=False)
+
+        class Meta:
+            indexes = ((("creator", "is_archived"), False),)
+
+    class Notify(Frozen):
+        user = ForeignKeyField(User)
+        room = ForeignKeyField(Room, index=False)
+
+        class Meta:
+            indexes = ((("room", "user"), True),)
+
+    class Answer(Frozen):
+        room = ForeignKeyField(Room, index=False)
+        text = CharField()
+
+        class Meta:
+            indexes = ((("room", "text"), True),)
+
+    class Appeal(Frozen):
+        room = ForeignKeyField(Room, index=False)
+        author = ForeignKeyField(User)
+        created_at = DateTimeField()
+        message = TextField()
+
+        class Meta:
+            indexes = ((("room", "created_at"), False),)
+
+    # В старых базах уникальных индексов не было
+    drop_duplicates(UserRole, UserRole.user, UserRole.role)
+    drop_duplicates(Notify, Notify.room, Notify.user)
+    drop_duplicates(Answer, Answer.room, Answer.text)
+    db.create_tables([Room, Appeal, User, Role, UserRole, Notify, Answer])
+    Role.get_or_create(name="Администратор")
+    Role.get_or_create(name="Сотрудник")
+
+
+@migration
+def room_digest() -> None:
+    class RoomDigest(Frozen):
+        room = ForeignKeyField(Room, unique=True)
+        interval = IntegerField()
+        threshold = IntegerField(default=20)
+
+    db.create_tables([RoomDigest])
+
+
+@migration
+def appeal_stats() -> None:
+    """Таблицы статистики. Старые обращения в них переносит stats.py"""
+
+    class AppealStat(Frozen):
+        room = ForeignKeyField(Room, index=False)
+        period = CharField()
+        start = DateTimeField()
+        count = IntegerField(default=0)
+
+        class Meta:
+            indexes = ((("room", "period", "start"), True),)
+
+    class AnswerStat(Frozen):
+        room = ForeignKeyField(Room, index=False)
+        text = CharField()
+        count = IntegerField(default=0)
+
+        class Meta:
+            indexes = ((("room", "text"), True),)
+
+    db.create_tables([AppealStat, AnswerStat])
+
+
+@migration
+def appeal_archive() -> None:
+    class ArchivedAppeal(Frozen):
+        id = IntegerField(primary_key=True)
+        room = ForeignKeyField(Room, index=False)
+        author = ForeignKeyField(User, index=False)
+        created_at = DateTimeField()
+        message = TextField()
+        archived_at = DateTimeField()
+
+        class Meta:
+            indexes = ((("room", "created_at"), False),)
+
+    db.create_tables([ArchivedAppeal])
+
+
+@migration
+def appeal_search() -> None:
+    """Полнотекстовый индекс appeal: FTS5 с триггерами в SQLite,
+    GIN-индекс в PostgreSQL"""
+    if not IS_SQLITE:
+        db.execute_sql(
+            "CREATE INDEX IF NOT EXISTS appeal_message_search ON appeal "
+            "USING GIN (to_tsvector('russian', message))"
+        )
+        return
+    if "appeal_fts" in db.get_tables():
+        return
+    db.execute_sql(
+        'CREATE VIRTUAL TABLE appeal_fts USING fts5 (message, '
+        'content=appeal, content_rowid=id, '
+        'tokenize="unicode61 remove_diacritics 2")'
+    )
+    db.execute_sql(
+        """CREATE TRIGGER appeal_fts_insert AFTER INSERT ON appeal
+        BEGIN
+            INSERT INTO appeal_fts (rowid, message) VALUES (new.id, new.message);
+        END"""
+    )
+    db.execute_sql(
+        """CREATE TRIGGER appeal_fts_delete AFTER DELETE ON appeal
+        BEGIN
+            INSERT INTO appeal_fts (appeal_fts, rowid, message)
+            VALUES ('delete', old.id, old.message);
+        END"""
+    )
+    db.execute_sql(
+        """CREATE TRIGGER appeal_fts_update AFTER UPDATE OF message ON appeal
+        BEGIN
+            INSERT INTO appeal_fts (appeal_fts, rowid, message)
+            VALUES ('delete', old.id, old.message);
+            INSERT INTO appeal_fts (rowid, message) VALUES (new.id, new.message);
+        END"""
+    )
+    db.execute_sql("INSERT INTO appeal_fts (appeal_fts) VALUES ('rebuild')")
+
+
+@migration
+def archived_appeal_search() -> None:
+    """Полнотекстовый индекс archivedappeal, как в appeal_search
+
+    Строки в архиве не меняются, поэтому триггер UPDATE не нужен.
+    """
+    if not IS_SQLITE:
+        db.execute_sql(
+            "CREATE INDEX IF NOT EXISTS archivedappeal_message_search "
+            "ON archivedappeal USING GIN (to_tsvector('russian', message))"
+        )
+        return
+    if "archivedappeal_fts" in db.get_tables():
+        return
+    db.execute_sql(
+        'CREATE VIRTUAL TABLE archivedappeal_fts USING fts5 (message, '
+        'content=archivedappeal, content_rowid=id, '
+        'tokenize="unicode61 remove_diacritics 2")'
+    )
+    db.execute_sql(
+        """CREATE TRIGGER archivedappeal_fts_insert
+        AFTER INSERT ON archivedappeal
+        BEGIN
+            INSERT INTO archivedappeal_fts (rowid, message)
+            VALUES (new.id, new.message);
+        END"""
+    )
+    db.execute_sql(
+        """CREATE TRIGGER archivedappeal_fts_delete
+        AFTER DELETE ON archivedappeal
+        BEGIN
+            INSERT INTO archivedappeal_fts (archivedappeal_fts, rowid, message)
+            VALUES ('delete', old.id, old.message);
+        END"""
+    )
+    db.execute_sql(
+        "INSERT INTO archivedappeal_fts (archivedappeal_fts) VALUES ('rebuild')"
+    )
+
+
+@migration
+def drop_prefix_indexes() -> None:
+    """Удаляет одиночные индексы внешних ключей из баз, созданных до
+    составных индексов: каждый - префикс составного из initial"""
+    for index in (
+        "room_creator_id", "appeal_room_id", "notify_room_id",
+        "answer_room_id", "userrole_user_id",
+    ):
+        db.execute_sql(f'DROP INDEX IF EXISTS "{index}"')
+
+
+def schema_version() -> int:
+    return SchemaVersion.select(fn.MAX(SchemaVersion.version)).scalar() or 0
+
+
+def migrate() -> int:
+    """Применяет недостающие миграции, возвращает их число"""
+    db.create_tables([SchemaVersion])
+    applied = 0
+    for version in range(schema_version() + 1, len(MIGRATIONS) + 1):
+        apply = MIGRATIONS[version - 1]
+        with write_transaction():
+            # Миграцию мог применить другой экземпляр бота
+            if schema_version() >= version:
+                continue
+            apply()
+            SchemaVersion.create(version=version)
+        logger.info("Применена миграция %s: %s", version, apply.__name__)
+        applied += 1
+    return applied
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    with db.connection_context():
+        migrate()
+        print(f"Версия схемы: {schema_version()}")
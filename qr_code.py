@@ -1,9 +1,54 @@
-from typing import Tuple
-import qrcode
+import asyncio
+import multiprocessing
+import os
+import re
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import IO, Dict, List, Optional, Tuple
 from io import BytesIO
 
 
+# Пул для отрисовки, чтобы работа PIL не занимала цикл событий
+EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="qr")
+
+# Пул процессов для архивов QR-кодов: один на процесс бота, создаётся
+# при первом /qr_all. Процессы запускаются через spawn, а не fork:
+# fork копировал бы процесс с работающими потоками БД и отрисовки
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+def process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            processes = os.getenv("QR_PROCESSES")
+            _process_pool = ProcessPoolExecutor(
+                int(processes) if processes else None,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _process_pool
+
+
+def shutdown() -> None:
+    """Останавливает пул процессов, если он запускался"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(cancel_futures=True)
+            _process_pool = None
+
+
+def get_url(room_id: int, bot_username: str) -> str:
+    return f"https://t.me/{bot_username}?start=room_{room_id}"
+
+
 def generate(room_id: int, bot_username: str) -> Tuple[BytesIO, str]:
+    # qrcode и PIL импортируются при первой отрисовке, а не при
+    # запуске бота: они нужны только обработчикам QR-кодов
+    import qrcode
+
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -11,7 +56,7 @@ def generate(room_id: int, bot_username: str) -> Tuple[BytesIO, str]:
         border=4,
     )
 
-    url = f"https://t.me/{bot_username}?start=room_{room_id}"
+    url = get_url(room_id, bot_username)
 
     qr.add_data(url)
     qr.make(fit=True)
@@ -24,3 +69,86 @@ def generate(room_id: int, bot_username: str) -> Tuple[BytesIO, str]:
     bio.seek(0)
 
     return bio, url
+
+
+async def render(room_id: int, bot_username: str) -> bytes:
+    """Отрисовывает QR-код в пуле и возвращает PNG"""
+    loop = asyncio.get_running_loop()
+    bio, _ = await loop.run_in_executor(
+        EXECUTOR, generate, room_id, bot_username
+    )
+    return bio.getvalue()
+
+
+def _label_font(size: int):
+    from PIL import ImageFont
+
+    # В шрифте Pillow по умолчанию нет кириллицы
+    try:
+        return ImageFont.truetype("DejaVuSans.ttf", size)
+    except OSError:
+        return ImageFont.load_default(size)
+
+
+def generate_labelled(
+    room: Tuple[int, str], bot_username: str
+) -> Tuple[str, bytes]:
+    """QR-код с подписью для печати: имя файла и PNG"""
+    from PIL import Image, ImageDraw
+
+    room_id, room_name = room
+    bio, _ = generate(room_id, bot_username)
+    code = Image.open(bio).convert("RGB")
+
+    font = _label_font(28)
+    label = Image.new("RGB", (code.width, code.height + 60), "white")
+    label.paste(code, (0, 0))
+    ImageDraw.Draw(label).text(
+        (code.width // 2, code.height + 20), room_name,
+        fill="black", font=font, anchor="mt",
+    )
+
+    png = BytesIO()
+    label.save(png, "PNG")
+    safe_name = re.sub(r'[\\/:*?"<>|\s]+', "_", room_name).strip("_")
+    return f"{room_id}_{safe_name}.png", png.getvalue()
+
+
+def write_zip(
+    rooms: List[Tuple[int, str]],
+    bot_username: str,
+    out: IO[bytes],
+    batch_size: int = 64,
+) -> None:
+    """Пишет в out ZIP с подписанными QR-кодами помещений
+
+    Коды рисуются в пуле process_pool пачками по batch_size, каждая
+    пачка сразу пишется в архив, поэтому в памяти не больше одной пачки.
+    """
+    pool = process_pool()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_STORED) as archive:
+        for start in range(0, len(rooms), batch_size):
+            batch = rooms[start:start + batch_size]
+            for filename, png in pool.map(
+                generate_labelled, batch, [bot_username] * len(batch)
+            ):
+                archive.writestr(filename, png)
+
+
+class QRCache:
+    """file_id уже загруженных в Telegram QR-кодов
+
+    Ключ - (room_id, bot_username): ссылка в коде зависит от имени бота.
+    """
+
+    def __init__(self) -> None:
+        self.file_ids: Dict[Tuple[int, str], str] = {}
+
+    def get(self, room_id: int, bot_username: str) -> Optional[str]:
+        return self.file_ids.get((room_id, bot_username))
+
+    def set(self, room_id: int, bot_username: str, file_id: str) -> None:
+        self.file_ids[(room_id, bot_username)] = file_id
+
+
+QR_CACHE = QRCache()
@@ -0,0 +1,115 @@
+"""Срок хранения обращений
+
+Фоновая задача раз в interval секунд переносит из appeal в
+archivedappeal обращения архивных помещений и обращения старше
+RETENTION_DAYS дней. Перенос идёт небольшими пачками с паузой между
+ними, затем свободные страницы возвращаются incremental_vacuum.
+
+Перенесённые обращения остаются в /search (у archivedappeal свой
+полнотекстовый индекс), в /export и в пересчёте stats.py, который
+читает обе таблицы. Счётчики статистики перенос не меняет.
+
+Чтобы incremental_vacuum работал в базе, созданной до включения
+auto_vacuum, её нужно один раз сжать при остановленном боте:
+
+    python retention.py --vacuum
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from dotenv import load_dotenv
+
+import dao
+
+
+logger = logging.getLogger(__name__)
+
+
+class Retention:
+    """Планировщик переноса обращений в архив"""
+
+    def __init__(
+        self,
+        days: int,
+        interval: float = 60 * 60,
+        batch_size: int = 500,
+        pause: float = 0.1,
+        vacuum_pages: int = 1000,
+    ) -> None:
+        # days == 0 - хранить без срока, переносить только архивные помещения
+        self.days = days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.vacuum_pages = vacuum_pages
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self._scheduler())
+
+    async def close(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def run_once(self) -> int:
+        """Переносит всё, что подлежит переносу, возвращает число обращений"""
+        cutoff = None
+        if self.days:
+            cutoff = datetime.now() - timedelta(days=self.days)
+        total = 0
+        while True:
+            moved = await dao.archive_appeals(cutoff, self.batch_size)
+            total += moved
+            if moved < self.batch_size:
+                break
+            # Даём обработчикам бота записать свои обращения
+            await asyncio.sleep(self.pause)
+        if total:
+            while await dao.incremental_vacuum(self.vacuum_pages):
+                await asyncio.sleep(self.pause)
+        return total
+
+    async def _scheduler(self) -> None:
+        while True:
+            try:
+                moved = await self.run_once()
+                if moved:
+                    logger.info("Перенесено в архив обращений: %s", moved)
+            except Exception:
+                logger.exception("Ошибка переноса обращений в архив")
+            await asyncio.sleep(self.interval)
+
+
+def retention() -> Retention:
+    """Планировщик с настройками из окружения"""
+    load_dotenv()
+    return Retention(
+        days=int(os.getenv("RETENTION_DAYS", "365")),
+        interval=float(os.getenv("RETENTION_INTERVAL", str(60 * 60))),
+        batch_size=int(os.getenv("RETENTION_BATCH", "500")),
+    )
+
+
+if __name__ == "__main__":
+    from models import IS_SQLITE, create_tables, db
+
+    parser = argparse.ArgumentParser(description="Перенос обращений в архив")
+    parser.add_argument(
+        "--vacuum", action="store_true",
+        help="сжать базу и включить auto_vacuum=incremental (бот остановлен)",
+    )
+    args = parser.parse_args()
+    if args.vacuum and not IS_SQLITE:
+        parser.error("--vacuum только для SQLite, в PostgreSQL есть autovacuum")
+    create_tables()
+    if args.vacuum:
+        db.execute_sql("PRAGMA auto_vacuum = incremental")
+        db.execute_sql("VACUUM")
+    print(f"Перенесено обращений: {asyncio.run(retention().run_once())}")
@@ -0,0 +1,250 @@
+"""Общая очередь исходящих сообщений с ограничением частоты отправки"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError, TelegramNetworkError, TelegramRetryAfter
+)
+from dotenv import load_dotenv
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не более capacity подряд"""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def take(self) -> float:
+        """Списывает токен и возвращает 0 или время ожидания до токена"""
+        delay = self.wait_time()
+        if delay == 0:
+            self.tokens -= 1
+        return delay
+
+    def wait_time(self) -> float:
+        """0, если токен есть, иначе время ожидания до него, не списывая"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+    async def acquire(self) -> None:
+        while (delay := self.take()) > 0:
+            await asyncio.sleep(delay)
+
+
+class Sender:
+    """Рассылает сообщения параллельно, соблюдая лимиты Telegram
+
+    Обработчики только ставят сообщения в очередь и сразу возвращаются,
+    отправкой занимаются фоновые воркеры. У каждого чата своя очередь
+    сообщений, воркеры берут из общей очереди ready чаты, которым уже
+    можно отправлять. Чат с исчерпанным ведром возвращается в ready
+    таймером, поэтому серия сообщений в один чат не занимает воркеры,
+    пока ждёт своё ведро, и не задерживает остальные чаты. Сообщения
+    одного чата отправляются по одному и по порядку.
+    """
+
+    # После скольких чатов чистить простаивающие вёдра
+    MAX_CHAT_BUCKETS = 10_000
+
+    def __init__(
+        self,
+        workers: int = 8,
+        global_rate: float = 30,
+        chat_rate: float = 1,
+        chat_burst: float = 1,
+        max_attempts: int = 3,
+    ) -> None:
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_attempts = max_attempts
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self.paused_until = 0.0
+        self.bot: Optional[Bot] = None
+        # Неотправленные (text, attempt) каждого чата, чат есть в словаре,
+        # пока у него есть сообщения
+        self.chats: Dict[int, Deque[Tuple[str, int]]] = {}
+        # Чаты, которым можно отправлять
+        self.ready: Optional[asyncio.Queue] = None
+        self.timers: Dict[int, asyncio.TimerHandle] = {}
+        self.unfinished = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.tasks: List[asyncio.Task] = []
+        # В процессе-обработчике (workers.py) сообщения передаются
+        # рассылке главного процесса: forward(chat_ids, text)
+        self.forward: Optional[Callable[[List[int], str], None]] = None
+
+    def start(self, bot: Bot) -> None:
+        """Запускает воркеры в текущем цикле событий"""
+        self.bot = bot
+        self.ready = asyncio.Queue()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self.workers)
+        ]
+
+    async def join(self) -> None:
+        """Дожидается отправки всех поставленных сообщений"""
+        await self.idle.wait()
+
+    async def close(self, timeout: float = 10) -> None:
+        """Дожидается отправки очереди и останавливает воркеры"""
+        if self.ready is not None:
+            try:
+                await asyncio.wait_for(self.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Не отправлено сообщений: %s", self.unfinished)
+        for timer in self.timers.values():
+            timer.cancel()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        self.timers = {}
+        self.chats = {}
+        self.unfinished = 0
+        self.ready = None
+
+    def send(self, chat_id: int, text: str) -> None:
+        """Ставит сообщение в очередь на отправку"""
+        if self.forward is not None:
+            self.forward([chat_id], text)
+            return
+        if self.ready is None:
+            raise RuntimeError("Sender не запущен")
+        self.unfinished += 1
+        self.idle.clear()
+        messages = self.chats.get(chat_id)
+        if messages is None:
+            self.chats[chat_id] = deque([(text, 1)])
+            self.ready.put_nowait(chat_id)
+        else:
+            # Чат уже в ready, в таймере или у воркера
+            messages.append((text, 1))
+
+    def send_many(self, chat_ids: Iterable[int], text: str) -> None:
+        """Ставит одно сообщение в очередь для нескольких чатов"""
+        if self.forward is not None:
+            self.forward(list(dict.fromkeys(chat_ids)), text)
+            return
+        for chat_id in dict.fromkeys(chat_ids):
+            self.send(chat_id, text)
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= self.MAX_CHAT_BUCKETS:
+                self.chat_buckets = {
+                    key: value for key, value in self.chat_buckets.items()
+                    if not value.is_full()
+                }
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _later(self, chat_id: int, delay: float) -> None:
+        """Возвращает чат в ready через delay секунд"""
+        self.timers[chat_id] = asyncio.get_running_loop().call_later(
+            delay, self._wake, chat_id
+        )
+
+    def _wake(self, chat_id: int) -> None:
+        self.timers.pop(chat_id, None)
+        if self.ready is not None:
+            self.ready.put_nowait(chat_id)
+
+    def _done(self) -> None:
+        self.unfinished -= 1
+        if self.unfinished == 0:
+            self.idle.set()
+
+    async def _worker(self) -> None:
+        while True:
+            chat_id: int = await self.ready.get()
+            delay = self._chat_bucket(chat_id).take()
+            if delay > 0:
+                self._later(chat_id, delay)
+                continue
+            messages = self.chats[chat_id]
+            text, attempt = messages.popleft()
+            retry = None
+            try:
+                retry = await self._deliver(chat_id, text, attempt)
+            except Exception:
+                logger.exception("Ошибка отправки сообщения в %s", chat_id)
+            if retry is not None:
+                messages.appendleft(retry)
+            else:
+                self._done()
+            if messages:
+                # Следующее сообщение чата: воркер проверит ведро и,
+                # если рано, отложит чат таймером
+                self.ready.put_nowait(chat_id)
+            else:
+                del self.chats[chat_id]
+
+    async def _deliver(
+        self, chat_id: int, text: str, attempt: int
+    ) -> Optional[Tuple[str, int]]:
+        """Отправляет сообщение, возвращает (text, attempt) для повтора"""
+        pause = self.paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        await self.global_bucket.acquire()
+
+        try:
+            await self.bot.send_message(chat_id, text)
+        except TelegramRetryAfter as ex:
+            # Telegram просит подождать: приостанавливаем все воркеры
+            self.paused_until = max(
+                self.paused_until, time.monotonic() + ex.retry_after
+            )
+            if attempt < self.max_attempts:
+                return text, attempt + 1
+            logger.warning("Сообщение в %s не отправлено: %s", chat_id, ex)
+        except TelegramNetworkError as ex:
+            # Сбой соединения, а не отказ Telegram: повторяем, пауза до
+            # повтора - ведро чата
+            if attempt < self.max_attempts:
+                return text, attempt + 1
+            logger.warning("Сообщение в %s не отправлено: %s", chat_id, ex)
+        except TelegramAPIError as ex:
+            # Например, пользователь заблокировал бота
+            logger.warning("Сообщение в %s не отправлено: %s", chat_id, ex)
+        return None
+
+
+load_dotenv()
+SENDER = Sender(
+    workers=int(os.getenv("SENDER_WORKERS", "8")),
+    global_rate=float(os.getenv("SENDER_GLOBAL_RATE", "30")),
+    chat_rate=float(os.getenv("SENDER_CHAT_RATE", "1")),
+)
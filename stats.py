@@ -0,0 +1,89 @@
+"""Пересчёт таблиц статистики обращений
+
+AppealStat и AnswerStat обновляются при каждом обращении в
+dao.create_appeal. Для обращений, сохранённых до появления статистики,
+таблицы пересчитываются один раз из Appeal и ArchivedAppeal (перенос
+в архив счётчики не меняет, поэтому архив считается вместе с appeal):
+
+    python stats.py
+"""
+
+from peewee import SQL, Select, Value, fn
+
+from models import (
+    IS_SQLITE, Answer, AnswerStat, Appeal, AppealStat, ArchivedAppeal,
+    create_tables, write_transaction
+)
+
+
+# Начало часа и дня в формате, в котором peewee хранит DateTimeField
+PERIODS = {
+    "hour": "%Y-%m-%d %H:00:00",
+    "day": "%Y-%m-%d 00:00:00",
+}
+
+
+def period_start(period: str, created_at):
+    """Начало часа или дня обращения"""
+    if IS_SQLITE:
+        return fn.strftime(PERIODS[period], created_at)
+    return fn.date_trunc(period, created_at)
+
+
+def history():
+    """Все обращения: appeal и перенесённые в archivedappeal"""
+    return (
+        Appeal.select(
+            Appeal.room.alias("room_id"), Appeal.created_at, Appeal.message
+        )
+        + ArchivedAppeal.select(
+            ArchivedAppeal.room, ArchivedAppeal.created_at,
+            ArchivedAppeal.message,
+        )
+    ).alias("history")
+
+
+def backfill() -> None:
+    """Пересчитывает статистику по всем обращениям одной транзакцией"""
+    appeals = history()
+    with write_transaction():
+        AppealStat.delete().execute()
+        AnswerStat.delete().execute()
+        for period in PERIODS:
+            start = period_start(period, appeals.c.created_at)
+            query = (
+                Select(
+                    [appeals],
+                    [appeals.c.room_id, Value(period), start, fn.COUNT(SQL("*"))],
+                )
+                .group_by(appeals.c.room_id, start)
+            )
+            AppealStat.insert_from(
+                query,
+                [AppealStat.room, AppealStat.period, AppealStat.start,
+                 AppealStat.count],
+            ).execute()
+
+        query = (
+            Select(
+                [appeals],
+                [appeals.c.room_id, appeals.c.message, fn.COUNT(SQL("*"))],
+            )
+            .join(Answer, on=(
+                (Answer.room == appeals.c.room_id)
+                & (Answer.text == appeals.c.message)
+            ))
+            .group_by(appeals.c.room_id, appeals.c.message)
+        )
+        AnswerStat.insert_from(
+            query, [AnswerStat.room, AnswerStat.text, AnswerStat.count]
+        ).execute()
+
+
+if __name__ == "__main__":
+    create_tables()
+    backfill()
+    print(
+        f"Часов и дней: {AppealStat.select().count()}, "
+        f"ответов: {AnswerStat.select().count()}"
+    )
@@ -0,0 +1,80 @@
+"""Запуск бота через вебхук вместо long polling
+
+Настройки берутся из окружения:
+WEBHOOK_URL - внешний адрес бота (https://example.com),
+WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT,
+WEBHOOK_CERT и WEBHOOK_KEY - самоподписанный сертификат, если нужен.
+"""
+
+import asyncio
+import os
+import ssl
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import FSInputFile
+from aiogram.webhook.aiohttp_server import (
+    SimpleRequestHandler,
+    setup_application,
+)
+from aiohttp import web
+
+
+def create_app(
+    dp: Dispatcher,
+    bot: Bot,
+    path: str = "/webhook",
+    secret: Optional[str] = None,
+) -> web.Application:
+    """Приложение aiohttp, принимающее обновления
+
+    Обновления обрабатываются в фоновых задачах, Telegram получает
+    ответ сразу.
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=secret,
+    ).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """Регистрирует вебхук в Telegram и принимает обновления"""
+    path = os.getenv("WEBHOOK_PATH", "/webhook")
+    secret = os.getenv("WEBHOOK_SECRET") or None
+    cert = os.getenv("WEBHOOK_CERT")
+    key = os.getenv("WEBHOOK_KEY")
+
+    ssl_context = None
+    if cert and key:
+        ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_context.load_cert_chain(cert, key)
+
+    async def on_startup(bot: Bot) -> None:
+        await bot.set_webhook(
+            url=os.getenv("WEBHOOK_URL").rstrip("/") + path,
+            certificate=FSInputFile(cert) if cert else None,
+            secret_token=secret,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=False,
+        )
+
+    dp.startup.register(on_startup)
+
+    runner = web.AppRunner(create_app(dp, bot, path=path, secret=secret))
+    await runner.setup()
+    site = web.TCPSite(
+        runner,
+        host=os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+        port=int(os.getenv("WEBHOOK_PORT", "8080")),
+        ssl_context=ssl_context,
+    )
+    await site.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
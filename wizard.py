@@ -0,0 +1,164 @@
+"""Отрисовка сообщений мастеров подписчиков и ответов
+
+Мастер - одно сообщение с inline-клавиатурой, которое правится на
+месте. Обработчики нажатий и ввода только меняют данные FSM и
+передают новую клавиатуру в WizardRenderer.render. Рендерер ждёт
+delay секунд, собирая серию нажатий, и отправляет одно
+editMessageReplyMarkup с последней клавиатурой. Клавиатура, которая
+уже показана, повторно не отправляется.
+
+В данных FSM мастер хранит только id выбранных помещений (selected)
+и номер страницы (page), названия берутся из dao.ROOM_NAMES.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError, TelegramBadRequest, TelegramRetryAfter
+)
+from aiogram.types import InlineKeyboardMarkup
+from dotenv import load_dotenv
+
+from dao import RoomNames
+
+
+logger = logging.getLogger(__name__)
+
+# (chat_id, message_id) сообщения мастера
+Key = Tuple[int, int]
+
+# Помещений на странице мастера: 4 ряда по 6
+PAGE_SIZE = 24
+
+
+def toggle(selected: List[int], room_id: int) -> List[int]:
+    """Отмечает помещение или снимает отметку"""
+    if room_id in selected:
+        selected.remove(room_id)
+    else:
+        selected.append(room_id)
+    return selected
+
+
+def selection_page(
+    rooms: RoomNames, page: int, selected: List[int]
+) -> Tuple[List[Tuple[int, str, bool]], Optional[int], Optional[int]]:
+    """Страница помещений с отметками, предыдущая и следующая страницы"""
+    last = max(0, (len(rooms.order) - 1) // PAGE_SIZE)
+    # Помещения могли архивировать, пока мастер открыт
+    page = min(page, last)
+    marked = set(selected)
+    items = [
+        (room_id, name, room_id in marked)
+        for room_id, name in rooms.page(page, PAGE_SIZE)
+    ]
+    return (
+        items,
+        page - 1 if page > 0 else None,
+        page + 1 if page < last else None,
+    )
+
+
+def _dump(markup: InlineKeyboardMarkup) -> str:
+    return markup.model_dump_json(exclude_none=True)
+
+
+class WizardRenderer:
+    """Правит клавиатуры сообщений мастеров с задержкой и без повторов"""
+
+    def __init__(self, delay: float = 0.3, max_messages: int = 10_000) -> None:
+        self.delay = delay
+        self.max_messages = max_messages
+        # Показанная клавиатура каждого сообщения
+        self.shown: Dict[Key, str] = {}
+        # Клавиатура, ждущая отправки
+        self.pending: Dict[Key, Tuple[Bot, InlineKeyboardMarkup]] = {}
+        self.tasks: Dict[Key, asyncio.Task] = {}
+
+    def sent(
+        self, chat_id: int, message_id: int, markup: InlineKeyboardMarkup
+    ) -> None:
+        """Запоминает клавиатуру только что отправленного сообщения"""
+        key = (chat_id, message_id)
+        if key not in self.shown and len(self.shown) >= self.max_messages:
+            self.shown.pop(next(iter(self.shown)))
+        self.shown[key] = _dump(markup)
+
+    def render(
+        self,
+        bot: Bot,
+        chat_id: int,
+        message_id: int,
+        markup: InlineKeyboardMarkup,
+    ) -> None:
+        """Ставит клавиатуру на отправку, заменяя ещё не отправленную"""
+        key = (chat_id, message_id)
+        self.pending[key] = (bot, markup)
+        if key not in self.tasks:
+            self.tasks[key] = asyncio.create_task(self._flush(key))
+
+    def forget(self, chat_id: int, message_id: int) -> None:
+        """Сообщение мастера удаляется: отменяет его правки"""
+        key = (chat_id, message_id)
+        task = self.tasks.pop(key, None)
+        if task is not None:
+            task.cancel()
+        self.pending.pop(key, None)
+        self.shown.pop(key, None)
+
+    async def close(self) -> None:
+        """Дожидается отправки отложенных правок"""
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+    async def _flush(self, key: Key) -> None:
+        try:
+            delay = self.delay
+            # Нажатия во время отправки попадают в pending и уходят
+            # следующей правкой
+            while key in self.pending:
+                await asyncio.sleep(delay)
+                bot, markup = self.pending.pop(key)
+                retry_after = await self._edit(bot, key, markup)
+                delay = self.delay
+                if retry_after is not None:
+                    # Повторяем, если за это время не появилась новая
+                    self.pending.setdefault(key, (bot, markup))
+                    delay = retry_after
+        finally:
+            if self.tasks.get(key) is asyncio.current_task():
+                del self.tasks[key]
+
+    async def _edit(
+        self, bot: Bot, key: Key, markup: InlineKeyboardMarkup
+    ) -> Optional[float]:
+        """Отправляет правку, возвращает паузу перед повтором или None"""
+        dumped = _dump(markup)
+        if self.shown.get(key) == dumped:
+            return None
+        chat_id, message_id = key
+        try:
+            await bot.edit_message_reply_markup(
+                chat_id=chat_id, message_id=message_id, reply_markup=markup
+            )
+        except TelegramRetryAfter as ex:
+            return ex.retry_after
+        except TelegramAPIError as ex:
+            if not (
+                isinstance(ex, TelegramBadRequest)
+                and "message is not modified" in ex.message
+            ):
+                # Например, сообщение уже удалено
+                logger.warning(
+                    "Клавиатура мастера в %s не обновлена: %s", chat_id, ex
+                )
+                return None
+        self.sent(chat_id, message_id, markup)
+        return None
+
+
+load_dotenv()
+WIZARD = WizardRenderer(delay=float(os.getenv("WIZARD_DELAY", "0.3")))
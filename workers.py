@@ -0,0 +1,391 @@
+"""Обработка обновлений в нескольких процессах
+
+При BOT_WORKERS=N главный процесс только принимает обновления
+(long polling или вебхук) и по id чата отправляет каждое одному из N
+процессов-обработчиков через unix-сокет. Обработчики запускают
+обычный диспетчер с add_routers. Обновления одного чата всегда
+попадают в один процесс и обрабатываются там по очереди, поэтому
+порядок внутри чата сохраняется, а FSM-кэш процесса не расходится
+с другими. Упавший обработчик перезапускается, обновления для него
+копятся в очереди до переподключения.
+
+Сокет двусторонний. Общее для всех процессов идёт через главный:
+
+- сброс кэша dao (ROOMS, ROLES, ROOM_NAMES) в одном обработчике
+  рассылается остальным, поэтому новые подписчики и архивация
+  помещения видны всем сразу, а не через ROOM_CACHE_TTL;
+- рассылка SENDER и сводки DIGEST выполняются только в главном
+  процессе: лимиты Telegram по чатам и на бота общие, у помещения
+  одна сводка за интервал.
+
+В каждом процессе остаются свои: кэш FSM и мастера (чат всегда в
+одном процессе), ведра AppealThrottleMiddleware (лимит помещения
+считается в каждом процессе отдельно, всего до N раз больше),
+метрики и пул соединений с БД. Ответы на сообщения и правки
+мастеров обработчик отправляет сам. Между записью в БД и приходом
+сброса другой процесс может ещё раз ответить из старого снимка.
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import struct
+import tempfile
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.types import Update
+from dotenv import load_dotenv
+
+import dao
+from digest import DIGEST
+from sender import SENDER
+
+
+logger = logging.getLogger(__name__)
+
+# Тип кадра, длина данных и ключ шарда
+HEADER = struct.Struct("!BIq")
+RESTART_DELAY = 1.0
+
+# Типы кадров. UPDATE - обновление обработчику, остальные - JSON:
+# INVALIDATE {cache, keys} - в обе стороны, SEND {chat_ids, text},
+# DIGEST_ADD (аргументы Digest.add) и DIGEST_FLUSH {room_id} - от
+# обработчика главному процессу
+UPDATE, INVALIDATE, SEND, DIGEST_ADD, DIGEST_FLUSH = range(5)
+DIGEST_FRAMES = {"add": DIGEST_ADD, "flush": DIGEST_FLUSH}
+
+
+def frame(kind: int, payload: bytes, key: int = 0) -> bytes:
+    return HEADER.pack(kind, len(payload), key) + payload
+
+
+def message(kind: int, data: Dict[str, Any]) -> bytes:
+    return frame(kind, json.dumps(data).encode())
+
+
+def shard_key(data: Dict[str, Any]) -> int:
+    """Чат обновления, для обновлений без чата - пользователь"""
+    chat = data.get("event_chat")
+    if chat is not None:
+        return chat.id
+    user = data.get("event_from_user")
+    return user.id if user is not None else 0
+
+
+class ChatLanes:
+    """Обрабатывает задачи с одним ключом строго по очереди,
+    с разными ключами - параллельно"""
+
+    def __init__(self) -> None:
+        self.tails: Dict[int, asyncio.Task] = {}
+
+    def submit(self, key: int, job: Callable[[], Awaitable[Any]]) -> None:
+        task = asyncio.create_task(self._run(self.tails.get(key), job))
+        self.tails[key] = task
+        task.add_done_callback(functools.partial(self._done, key))
+
+    def _done(self, key: int, task: asyncio.Task) -> None:
+        if self.tails.get(key) is task:
+            del self.tails[key]
+
+    @staticmethod
+    async def _run(previous: Optional[asyncio.Task], job) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await job()
+        except Exception:
+            logger.exception("Ошибка обработки обновления")
+
+    async def join(self) -> None:
+        while self.tails:
+            await asyncio.wait(list(self.tails.values()))
+
+
+class WorkerPool:
+    """Процессы-обработчики и очереди обновлений для них"""
+
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+        self.directory = tempfile.mkdtemp(prefix="bot-workers-")
+        self.path = os.path.join(self.directory, "intake.sock")
+        self.context = multiprocessing.get_context("spawn")
+        self.processes: List[Optional[multiprocessing.Process]] = (
+            [None] * workers
+        )
+        self.queues: List[asyncio.Queue] = [
+            asyncio.Queue() for _ in range(workers)
+        ]
+        self.connected: List[asyncio.Event] = [
+            asyncio.Event() for _ in range(workers)
+        ]
+        self.writers: List[Optional[asyncio.StreamWriter]] = [None] * workers
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.tasks: List[asyncio.Task] = []
+        self.closing = False
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_unix_server(self._accept, self.path)
+        for index in range(self.workers):
+            self._spawn(index)
+            self.tasks.append(asyncio.create_task(self._writer(index)))
+        self.tasks.append(asyncio.create_task(self._supervisor()))
+
+    def submit(self, key: int, payload: bytes) -> None:
+        self.queues[key % self.workers].put_nowait(frame(UPDATE, payload, key))
+
+    def broadcast(self, data: bytes, source: int) -> None:
+        """Передаёт кадр всем обработчикам, кроме source"""
+        for index, queue in enumerate(self.queues):
+            if index != source:
+                queue.put_nowait(data)
+
+    async def close(self, timeout: float = 30) -> None:
+        """Дожидается отправки очередей и даёт обработчикам завершиться"""
+        self.closing = True
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self.queues)),
+                timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Не все обновления переданы обработчикам")
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        # Конец потока - сигнал обработчику доделать работу и выйти.
+        # Его рассылки читаются, пока он не закроет сокет
+        for writer in self.writers:
+            if writer is not None:
+                writer.write_eof()
+        loop = asyncio.get_running_loop()
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                process.terminate()
+        for writer in self.writers:
+            if writer is not None:
+                writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+        os.remove(self.path)
+        os.rmdir(self.directory)
+
+    def _spawn(self, index: int) -> None:
+        process = self.context.Process(
+            target=worker_main,
+            args=(index, self.workers, self.path),
+            name=f"bot-worker-{index}",
+        )
+        process.start()
+        self.processes[index] = process
+
+    async def _accept(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        index, = struct.unpack("!I", await reader.readexactly(4))
+        if self.writers[index] is not None:
+            self.writers[index].close()
+        self.writers[index] = writer
+        self.connected[index].set()
+        await self._read(index, reader)
+
+    async def _read(self, index: int, reader: asyncio.StreamReader) -> None:
+        """Кадры от обработчика: сбросы кэшей, рассылки и сводки"""
+        while True:
+            try:
+                kind, size, _ = HEADER.unpack(
+                    await reader.readexactly(HEADER.size)
+                )
+                payload = await reader.readexactly(size)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            try:
+                if kind == INVALIDATE:
+                    self.broadcast(frame(kind, payload), index)
+                    continue
+                data = json.loads(payload)
+                if kind == SEND:
+                    SENDER.send_many(data["chat_ids"], data["text"])
+                elif kind == DIGEST_ADD:
+                    DIGEST.add(**data)
+                elif kind == DIGEST_FLUSH:
+                    DIGEST.flush(data["room_id"])
+            except Exception:
+                logger.exception("Ошибка кадра %s от обработчика %s", kind, index)
+
+    async def _writer(self, index: int) -> None:
+        queue = self.queues[index]
+        while True:
+            frame = await queue.get()
+            while True:
+                await self.connected[index].wait()
+                writer = self.writers[index]
+                try:
+                    writer.write(frame)
+                    await writer.drain()
+                    break
+                except ConnectionError:
+                    # Обработчик упал, ждём перезапущенный
+                    self.connected[index].clear()
+            queue.task_done()
+
+    async def _supervisor(self) -> None:
+        while True:
+            await asyncio.sleep(RESTART_DELAY)
+            for index, process in enumerate(self.processes):
+                if process.is_alive() or self.closing:
+                    continue
+                logger.error(
+                    "Обработчик %s завершился с кодом %s, перезапуск",
+                    index, process.exitcode,
+                )
+                self.connected[index].clear()
+                self._spawn(index)
+
+
+class ShardMiddleware(BaseMiddleware):
+    """Внешний middleware главного процесса: вместо обработки
+    отправляет обновление обработчику по id чата"""
+
+    def __init__(self, pool: WorkerPool) -> None:
+        self.pool = pool
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        payload = event.model_dump_json(exclude_unset=True).encode()
+        self.pool.submit(shard_key(data), payload)
+        return True
+
+
+async def run_intake(
+    bot: Bot,
+    workers: int,
+    receive: Callable[[Dispatcher, Bot], Awaitable[None]],
+) -> None:
+    """Главный процесс: принимает обновления и раздаёт обработчикам"""
+    SENDER.start(bot)
+    DIGEST.start()
+    pool = WorkerPool(workers)
+    await pool.start()
+    dp = Dispatcher()
+    dp.update.outer_middleware(ShardMiddleware(pool))
+    try:
+        await receive(dp, bot)
+    finally:
+        await pool.close()
+        await DIGEST.close()
+        await SENDER.close()
+
+
+async def receive_from_intake(
+    index: int, path: str, dp: Dispatcher, bot: Bot
+) -> None:
+    """Обработчик: читает обновления из сокета главного процесса"""
+    reader, writer = await asyncio.open_unix_connection(path)
+    writer.write(struct.pack("!I", index))
+    await writer.drain()
+
+    loop = asyncio.get_running_loop()
+    # Кадры главному процессу пишет одна задача с drain, чтобы
+    # записи не копились в буфере сокета без ограничения
+    outgoing: asyncio.Queue = asyncio.Queue()
+    sending = asyncio.create_task(send_to_intake(writer, outgoing))
+
+    def invalidated(cache: str, keys: tuple) -> None:
+        # Сбросы бывают и из потоков пула БД
+        loop.call_soon_threadsafe(
+            outgoing.put_nowait,
+            message(INVALIDATE, {"cache": cache, "keys": keys}),
+        )
+
+    dao.INVALIDATION_LISTENERS.append(invalidated)
+    SENDER.forward = lambda chat_ids, text: outgoing.put_nowait(
+        message(SEND, {"chat_ids": chat_ids, "text": text})
+    )
+    DIGEST.forward = lambda method, data: outgoing.put_nowait(
+        message(DIGEST_FRAMES[method], data)
+    )
+
+    lanes = ChatLanes()
+    try:
+        while True:
+            try:
+                kind, size, key = HEADER.unpack(
+                    await reader.readexactly(HEADER.size)
+                )
+                payload = await reader.readexactly(size)
+            except asyncio.IncompleteReadError:
+                break
+            if kind == INVALIDATE:
+                data = json.loads(payload)
+                dao.drop_cached(data["cache"], data["keys"])
+                continue
+            update = Update.model_validate_json(payload, context={"bot": bot})
+            lanes.submit(
+                key, functools.partial(dp.feed_update, bot, update)
+            )
+    finally:
+        await lanes.join()
+        dao.INVALIDATION_LISTENERS.remove(invalidated)
+        SENDER.forward = None
+        DIGEST.forward = None
+        # Рассылки и сбросы должны дойти до главного процесса до выхода
+        joined = asyncio.create_task(outgoing.join())
+        await asyncio.wait(
+            [sending, joined], return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in (sending, joined):
+            task.cancel()
+        await asyncio.gather(sending, joined, return_exceptions=True)
+        if outgoing.qsize():
+            logger.error(
+                "Главному процессу не переданы кадры: %s", outgoing.qsize()
+            )
+        writer.close()
+
+
+async def send_to_intake(
+    writer: asyncio.StreamWriter, outgoing: asyncio.Queue
+) -> None:
+    """Пишет кадры обработчика в сокет главного процесса по очереди"""
+    while True:
+        data = await outgoing.get()
+        try:
+            writer.write(data)
+            await writer.drain()
+        except ConnectionError:
+            # Главный процесс закрыл сокет, дальше писать некуда
+            outgoing.put_nowait(data)
+            return
+        outgoing.task_done()
+
+
+def worker_main(index: int, workers: int, path: str) -> None:
+    """Точка входа процесса-обработчика"""
+    # Остановкой управляет главный процесс, закрывая сокет
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    load_dotenv()
+    # У каждого процесса свой /metrics на следующих портах
+    if os.getenv("METRICS_PORT"):
+        os.environ["METRICS_PORT"] = str(
+            int(os.getenv("METRICS_PORT")) + 1 + index
+        )
+    logging.basicConfig(level=logging.INFO)
+
+    from main import create_bot, run_dispatcher
+
+    asyncio.run(
+        run_dispatcher(
+            create_bot(), functools.partial(receive_from_intake, index, path)
+        )
+    )